@@ -0,0 +1,182 @@
+# --- IMPORTS ---
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+## ----------------------------------------------------------------
+## MÉTRICAS (CONTADORES, GAUGES E HISTOGRAMAS CON ETIQUETAS)
+## ----------------------------------------------------------------
+#Mismo modelo que Prometheus: cada métrica tiene un nombre y un conjunto de
+#etiquetas (p. ej. la cámara). Todo vive en memoria y se protege con un lock
+#por métrica, así que registrar un valor cuesta un dict lookup y una suma; el
+#texto para /metrics solo se arma cuando alguien lo pide.
+#Este módulo es el núcleo común a los tres servicios (nodoCamara,
+#nodoProcesamiento y nodoServer): cada uno lo copia en su imagen como
+#comun/metricas.py y define sus métricas en su propio metricas.py.
+#
+#Los hilos del servicio escriben mientras /metrics o summary() leen: quien lee
+#nunca recorre `values` directamente, sino una copia hecha bajo el lock
+#(snapshot() / samples()).
+
+
+class Counter:
+    TYPE = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def snapshot(self):
+        #Copia de {etiquetas: valor}
+        with self.lock:
+            return dict(self.values)
+
+    def samples(self):
+        return [(self.name, labels, (), value) for labels, value in self.snapshot().items()]
+
+
+class Gauge(Counter):
+    #Valor que sube y baja (profundidad de una cola, tracks activos)
+    TYPE = 'gauge'
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def remove(self, *labels):
+        with self.lock:
+            self.values.pop(labels, None)
+
+
+class Histogram:
+    TYPE = 'histogram'
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        #Por etiqueta: [conteos por bucket (+Inf al final), suma, cantidad]
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        #Copia de {etiquetas: (conteos por bucket, suma, cantidad)}
+        with self.lock:
+            return {labels: (list(state[0]), state[1], state[2]) for labels, state in self.values.items()}
+
+    def quantile(self, q, *labels):
+        with self.lock:
+            state = self.values.get(labels)
+            counts = list(state[0]) if state else None
+        return self._quantile(q, counts)
+
+    def _quantile(self, q, counts):
+        #Aproximación: límite superior del bucket donde cae el cuantil
+        total = sum(counts) if counts else 0
+        if not total:
+            return None
+        target = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        out = []
+        for labels, (counts, total, count) in self.snapshot().items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                out.append((self.name + '_bucket', labels, (('le', le),), cumulative))
+            out.append((self.name + '_sum', labels, (), total))
+            out.append((self.name + '_count', labels, (), count))
+        return out
+
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def exposition():
+    #Todas las métricas en el formato de texto de Prometheus
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+        for name, labels, extra, value in metric.samples():
+            pairs = list(zip(metric.labelnames, labels)) + list(extra)
+            tag = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+            lines.append(f"{name}{{{tag}}} {value}" if tag else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    #Resumen legible de todas las métricas, para imprimir en el log
+    lines = []
+    for metric in REGISTRY:
+        values = metric.snapshot()
+        for labels in sorted(values):
+            tag = ",".join(f"{k}={v}" for k, v in zip(metric.labelnames, labels))
+            if isinstance(metric, Histogram):
+                counts, total, count = values[labels]
+                mean = total / count if count else 0.0
+                p95 = metric._quantile(0.95, counts)
+                lines.append(f"{metric.name}{{{tag}}} n={count} media={mean:.3f} p95<={p95}")
+            else:
+                lines.append(f"{metric.name}{{{tag}}} {values[labels]}")
+    return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host, port):
+    #Servidor /metrics en un hilo aparte; no toca el hilo principal del servicio
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
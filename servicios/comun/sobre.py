@@ -0,0 +1,66 @@
+# --- IMPORTS ---
+import struct
+
+## ----------------------------------------------------------------
+## SOBRE BINARIO DE LOS FRAMES (EMISOR -> PROCESAMIENTO)
+## ----------------------------------------------------------------
+#Cada mensaje de frame es una cabecera fija + el ID de la cámara + el JPEG:
+#
+#  magic 'VF' | versión | flags | ancho | alto | seq | capture_ts | movimiento | largo id | id | JPEG
+#     2 B        1 B      1 B     2 B    2 B    8 B      8 B           4 B         2 B
+#
+#Enteros en orden de red. seq es un contador del emisor por cámara (empieza en
+#1 y sube con cada frame publicado): un salto en el procesamiento es un frame
+#perdido en el camino. capture_ts es el epoch de la captura. El puntaje de
+#movimiento es opcional (flag FLAG_MOTION). Un JPEG empieza con FF D8, así que
+#un cuerpo sin el magic es un JPEG "pelado" de un emisor viejo.
+#Lo usan nodoCamara (pack) y nodoProcesamiento (unpack).
+MAGIC = b'VF'
+VERSION = 1
+FLAG_MOTION = 0x01
+CONTENT_TYPE = 'application/x-frame-envelope'
+HEADER = struct.Struct('!2sBBHHQdfH')
+
+
+class Envelope:
+    __slots__ = ('version', 'camera_id', 'seq', 'captured_at', 'width', 'height', 'motion', 'jpeg')
+
+    def __init__(self, version, camera_id, seq, captured_at, width, height, motion, jpeg):
+        self.version = version
+        self.camera_id = camera_id
+        self.seq = seq
+        self.captured_at = captured_at
+        self.width = width
+        self.height = height
+        #None si el emisor no lo calculó
+        self.motion = motion
+        #memoryview sobre el cuerpo del mensaje (sin copiar)
+        self.jpeg = jpeg
+
+
+def pack(camera_id, seq, captured_at, width, height, jpeg, motion=None):
+    #jpeg puede ser bytes o el arreglo de cv2.imencode: se copia una sola vez
+    camera = camera_id.encode('utf-8')
+    flags = FLAG_MOTION if motion is not None else 0
+    header = HEADER.pack(MAGIC, VERSION, flags, width, height, seq, captured_at,
+                         motion if motion is not None else 0.0, len(camera))
+    return b''.join((header, camera, jpeg))
+
+
+def unpack(body):
+    #Devuelve un Envelope, o None si el cuerpo es un JPEG sin sobre.
+    #ValueError si el sobre está truncado o es de una versión desconocida.
+    view = memoryview(body)
+    if view[:2] != MAGIC:
+        return None
+    if len(view) < HEADER.size:
+        raise ValueError("sobre truncado")
+    _, version, flags, width, height, seq, captured_at, motion, id_length = HEADER.unpack_from(view)
+    if version != VERSION:
+        raise ValueError(f"versión de sobre desconocida: {version}")
+    start = HEADER.size + id_length
+    if len(view) < start:
+        raise ValueError("sobre truncado")
+    camera_id = str(view[HEADER.size:start], 'utf-8')
+    return Envelope(version, camera_id, seq, captured_at, width, height,
+                    motion if flags & FLAG_MOTION else None, view[start:])
@@ -0,0 +1,122 @@
+# --- IMPORTS ---
+import json
+import math
+import threading
+import time
+
+from metricas import PROCESSING_LOAD
+
+## ----------------------------------------------------------------
+## CONTROL ADAPTATIVO DE FPS Y CALIDAD
+## ----------------------------------------------------------------
+#Los nodos de procesamiento publican su carga (0 = ocioso, 1 = saturado) en el
+#exchange fanout camera_control. El emisor usa la mayor carga reciente: si pasa
+#de HIGH baja fps y calidad JPEG; si queda bajo LOW las recupera de a poco.
+#Con enrutamiento por shards cada nodo anuncia además sus shards, y la cámara
+#mira solo la carga del nodo dueño del suyo (si nadie lo anuncia, la de todos).
+#El ajuste lo dispara tick(), que el hilo de codificación llama en cada vuelta:
+#si los nodos dejan de reportar, sus cargas vencen y el ritmo se recupera.
+CONTROL_EXCHANGE = 'camera_control'
+
+
+class AdaptiveRate:
+    HIGH = 0.8
+    LOW = 0.4
+    #Una carga reportada hace más de esto se ignora (el nodo pudo haber salido)
+    FEEDBACK_TTL = 10.0
+    #Con varios nodos reportando, ajustar como mucho una vez por este intervalo
+    ADJUST_INTERVAL = 1.0
+
+    def __init__(self, max_fps, min_fps, max_quality, min_quality, shard=None):
+        self.max_fps = max_fps
+        self.min_fps = min(min_fps, max_fps)
+        self.max_quality = max_quality
+        self.min_quality = min(min_quality, max_quality)
+        self.fps = max_fps
+        self.quality = max_quality
+        #Shard de la cámara, o None si no se enruta por shards
+        self.shard = shard
+        #node_id -> (carga, momento en que llegó, shards del nodo o None)
+        self.loads = {}
+        self.next_adjust = 0.0
+        #on_control corre en el hilo del publicador y tick() en el de codificación
+        self.lock = threading.Lock()
+
+    def on_control(self, ch, method, properties, body):
+        #Corre dentro del ioloop del publicador: un mensaje malo se descarta, no
+        #puede levantar una excepción
+        try:
+            message = json.loads(body)
+            if not isinstance(message, dict):
+                raise ValueError(f"se esperaba un objeto, llegó {type(message).__name__}")
+            node_id, load = message['node_id'], message['load']
+            if not isinstance(node_id, str):
+                raise ValueError(f"node_id inválido: {node_id!r}")
+            if isinstance(load, bool) or not isinstance(load, (int, float)) or not math.isfinite(load):
+                raise ValueError(f"load inválido: {load!r}")
+            shards = message.get('shards')
+            if shards is not None:
+                if not isinstance(shards, list) or not all(isinstance(shard, int) for shard in shards):
+                    raise ValueError(f"shards inválido: {shards!r}")
+                shards = frozenset(shards)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Mensaje de control inválido: {e}")
+            return
+        with self.lock:
+            self.loads[node_id] = (float(load), time.monotonic(), shards)
+        self.tick()
+
+    def tick(self):
+        #Ajusta como mucho una vez por ADJUST_INTERVAL
+        with self.lock:
+            now = time.monotonic()
+            if now < self.next_adjust:
+                return
+            self.next_adjust = now + self.ADJUST_INTERVAL
+            self._adjust()
+
+    def current_load(self):
+        #Se llama con el lock tomado. Los nodos que dejaron de reportar se olvidan
+        now = time.monotonic()
+        for node_id in [node_id for node_id, (_, seen, _) in self.loads.items() if now - seen > self.FEEDBACK_TTL]:
+            del self.loads[node_id]
+        recent = [(load, shards) for load, _, shards in self.loads.values()]
+        if self.shard is not None:
+            owners = [load for load, shards in recent if shards is not None and self.shard in shards]
+            if owners:
+                return max(owners)
+        return max((load for load, _ in recent), default=0.0)
+
+    def _adjust(self):
+        load = self.current_load()
+        PROCESSING_LOAD.set(load)
+        fps, quality = self.fps, self.quality
+        if load > self.HIGH:
+            fps = max(self.min_fps, fps * 0.75)
+            quality = max(self.min_quality, quality - 10)
+        elif load < self.LOW:
+            fps = min(self.max_fps, fps * 1.1 + 0.1)
+            quality = min(self.max_quality, quality + 5)
+        if (round(fps, 1), quality) != (round(self.fps, 1), self.quality):
+            print(f"Carga de procesamiento {load:.2f}: {fps:.1f} fps, calidad JPEG {quality}.")
+        self.fps, self.quality = fps, quality
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+
+class FrameScheduler:
+    #Marca el ritmo con plazos absolutos: el tiempo de captura/codificación/
+    #publicación se descuenta de la espera en vez de sumarse a ella.
+
+    def __init__(self):
+        self.next_deadline = time.monotonic()
+
+    def time_until_next(self, interval):
+        now = time.monotonic()
+        self.next_deadline += interval
+        #Si vamos atrasados más de un intervalo no intentamos recuperar: se pierde ese turno
+        if self.next_deadline < now - interval:
+            self.next_deadline = now
+        return max(0.0, self.next_deadline - now)
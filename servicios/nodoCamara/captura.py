@@ -0,0 +1,203 @@
+# --- IMPORTS ---
+import os
+import threading
+import time
+
+import cv2
+
+from adaptacion import FrameScheduler
+from comun import sobre
+import metricas
+
+## ----------------------------------------------------------------
+## CAPTURA EN SU PROPIO HILO (SOLO EL ÚLTIMO FRAME)
+## ----------------------------------------------------------------
+#cap.read() corre sin parar en un hilo y cada frame nuevo reemplaza al
+#anterior. Así el búfer interno de la cámara nunca se llena de frames viejos
+#aunque la codificación o RabbitMQ se atrasen: quien pide un frame recibe
+#siempre el más reciente. Los frames reemplazados sin haberse usado se cuentan
+#como 'superseded'. Con reconnect=True (streamManager.py) una fuente caída se
+#reabre en el mismo hilo sin afectar a las demás cámaras.
+
+
+class CaptureThread:
+    RECONNECT_MIN_SECONDS = 1.0
+
+    def __init__(self, source, camera_id, reconnect=False, loop=False, reconnect_max_seconds=30.0):
+        #reconnect: si la fuente falla (cámara desconectada, RTSP caído) se
+        #reabre con espera exponencial en vez de terminar. loop: los archivos
+        #de video vuelven al principio al terminar.
+        self.source = source
+        self.camera_id = camera_id
+        self.reconnect = reconnect
+        self.loop = loop
+        self.reconnect_max_seconds = reconnect_max_seconds
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.capture = None
+        self.interval = 0.0
+        self.frame = None
+        self.captured_at = None
+        self.seq = 0
+        self.taken_seq = 0
+        self.running = False
+        self.stopped = threading.Event()
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name=f'capture-{camera_id}', daemon=True)
+
+    def start(self):
+        #Sin reconnect, una fuente que no abre es un error inmediato. Con
+        #reconnect la primera apertura también la hace el hilo: una URL RTSP que
+        #no responde no demora el arranque de las demás cámaras
+        if not self.reconnect and not self._open():
+            raise IOError(f"No se puede abrir la cámara {self.source!r}")
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+        self.thread.join()
+
+    def latest(self, after_seq, timeout):
+        #Devuelve (seq, frame, captured_at) del frame más nuevo posterior a
+        #after_seq, o None si no llegó ninguno en timeout segundos
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq != after_seq or not self.running, timeout)
+            if self.seq == after_seq:
+                return None
+            self.taken_seq = self.seq
+            return self.seq, self.frame, self.captured_at
+
+    def _open(self):
+        self.capture = cv2.VideoCapture(self.source)
+        if not self.capture.isOpened():
+            self.capture.release()
+            self.capture = None
+            metricas.SOURCE_UP.set(0, self.camera_id)
+            return False
+        if self.is_file:
+            #Un archivo se lee a su fps real, como si fuera una cámara
+            self.interval = 1.0 / (self.capture.get(cv2.CAP_PROP_FPS) or 25.0)
+        else:
+            #Que el driver no guarde frames viejos (no todos los backends lo respetan)
+            self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        metricas.SOURCE_UP.set(1, self.camera_id)
+        return True
+
+    def _run(self):
+        backoff = self.RECONNECT_MIN_SECONDS
+        scheduler = FrameScheduler()
+        opened = self.capture is not None
+
+        while self.running:
+            if self.capture is None:
+                if not self._open():
+                    print(f"No se pudo abrir '{self.camera_id}'. Reintentando en {backoff:.0f} s...")
+                    self.stopped.wait(backoff)
+                    backoff = min(backoff * 2, self.reconnect_max_seconds)
+                    continue
+                print(f"Fuente '{self.camera_id}' {'reconectada' if opened else 'abierta'}.")
+                opened = True
+                backoff = self.RECONNECT_MIN_SECONDS
+
+            started = time.perf_counter()
+            ok, frame = self.capture.read()
+            if not ok and self.is_file and self.loop:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, frame = self.capture.read()
+            if not ok:
+                metricas.FRAMES_FAILED.inc(self.camera_id, 'capture')
+                if not self.reconnect or self.is_file:
+                    print(f"No se pudo leer el frame de '{self.camera_id}'. Deteniendo la captura.")
+                    break
+                print(f"Se perdió la fuente '{self.camera_id}'. Reconectando...")
+                metricas.SOURCE_UP.set(0, self.camera_id)
+                self.capture.release()
+                self.capture = None
+                continue
+            metricas.STAGE_SECONDS.observe(time.perf_counter() - started, 'capture')
+            with self.condition:
+                if self.seq != self.taken_seq:
+                    metricas.FRAMES_DROPPED.inc(self.camera_id, 'superseded')
+                self.frame = frame
+                self.captured_at = time.time()
+                self.seq += 1
+                self.condition.notify_all()
+            if self.interval:
+                self.stopped.wait(scheduler.time_until_next(self.interval))
+
+        if self.capture is not None:
+            self.capture.release()
+        metricas.SOURCE_UP.set(0, self.camera_id)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+
+## ----------------------------------------------------------------
+## CODIFICACIÓN AL RITMO DEL CONTROL ADAPTATIVO
+## ----------------------------------------------------------------
+#Toma el último frame al ritmo que fija AdaptiveRate, lo reduce, lo codifica a
+#JPEG y se lo pasa a publish(body, captured_at). publish no bloquea (deja el
+#mensaje en el anillo del publicador), así que una demora del broker no frena
+#ni la captura ni la codificación. Con envelope=True el cuerpo es el sobre de
+#comun/sobre.py (ID, seq, hora de captura y tamaño + JPEG) en vez del JPEG solo.
+
+
+class EncoderThread:
+    def __init__(self, capture, rate, width, height, publish, envelope=False):
+        self.capture = capture
+        self.camera_id = capture.camera_id
+        self.rate = rate
+        self.size = (width, height)
+        self.publish = publish
+        self.envelope = envelope
+        #Número del último frame publicado; el procesamiento detecta pérdidas por los saltos
+        self.sent = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'encode-{self.camera_id}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def _run(self):
+        scheduler = FrameScheduler()
+        seq = 0
+        while not self.stopped.is_set():
+            #Vence la carga de los nodos que dejaron de reportar, aunque no llegue control
+            self.rate.tick()
+            item = self.capture.latest(seq, timeout=1.0)
+            if item is None:
+                if not self.capture.running:
+                    break
+                continue
+            seq, frame, captured_at = item
+
+            #Reducir a la resolución del procesamiento y codificar
+            started = time.perf_counter()
+            if (frame.shape[1], frame.shape[0]) != self.size:
+                frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+            result, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.rate.quality])
+            metricas.STAGE_SECONDS.observe(time.perf_counter() - started, 'encode')
+            if not result:
+                metricas.FRAMES_FAILED.inc(self.camera_id, 'encode')
+                continue
+            metricas.FRAME_BYTES.observe(len(buffer), self.camera_id)
+            metricas.TARGET_FPS.set(round(self.rate.fps, 2), self.camera_id)
+            metricas.JPEG_QUALITY.set(self.rate.quality, self.camera_id)
+            self.sent += 1
+            if self.envelope:
+                body = sobre.pack(self.camera_id, self.sent, captured_at, self.size[0], self.size[1], buffer)
+            else:
+                body = buffer.tobytes()
+            self.publish(body, captured_at)
+
+            #Esperar hasta el próximo plazo (o hasta que nos detengan)
+            self.stopped.wait(scheduler.time_until_next(self.rate.interval))
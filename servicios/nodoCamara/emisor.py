@@ -1,133 +1,61 @@
-import pika
-import time
-import os
-import cv2
-import base64
-import ssl
-import traceback
-import pika.credentials
+import signal
+from adaptacion import CONTROL_EXCHANGE, AdaptiveRate
+from captura import CaptureThread, EncoderThread
+from config import (CAMERA_ID, CAMERA_INDEX, CA_CERT_PATH, CLIENT_CERT_PATH, CLIENT_KEY_PATH, FRAME_ENVELOPE,
+                    FRAME_HEIGHT, FRAME_QUEUE_ARGUMENTS, FRAME_ROUTING, FRAME_WIDTH, LIVE_MODE, MAX_FPS,
+                    MAX_JPEG_QUALITY, METRICS_HOST, METRICS_PORT, MIN_FPS, MIN_JPEG_QUALITY,
+                    PUBLISH_MAX_IN_FLIGHT, PUBLISH_RING_SIZE, RABBITMQ_HOST, RABBITMQ_PORT, SHARD_COUNT)
+from comun.metricas import start_metrics_server
+from publicador import (AsyncPublisher, camera_shard, connection_params, consume_fanout, frame_publisher,
+                        frame_route)
 
 ## ----------------------------------------------------------------
-## LEER CONFIGURACIÓN DESDE VARIABLES DE ENTORNO
+## CONEXIÓN (PUBLICADOR ASÍNCRONO CON REINTENTOS)
 ## ----------------------------------------------------------------
-RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
-RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', 5671)) 
-CAMERA_INDEX = int(os.getenv('CAMERA_INDEX', 0))
-CAMERA_ID = os.getenv('CAMERA_ID','Camara Notebook')
+#Una sola cámara por proceso; para varias cámaras ver streamManager.py.
+#El publicador se conecta y reconecta solo, con espera exponencial. Al abrir
+#cada canal declara la cola o el exchange de frames y se suscribe al control.
+try:
+    params = connection_params(RABBITMQ_HOST, RABBITMQ_PORT, CA_CERT_PATH, CLIENT_CERT_PATH, CLIENT_KEY_PATH)
+except Exception as e:
+    print(f"Error fatal creando el contexto SSL: {e}")
+    exit(1)
 
-CA_CERT_PATH = os.getenv('CA_CERT')
-CLIENT_CERT_PATH = os.getenv('CLIENT_CERT')
-CLIENT_KEY_PATH = os.getenv('CLIENT_KEY')
+exchange, routing_key, declare_frames = frame_route(CAMERA_ID, FRAME_ROUTING, SHARD_COUNT, FRAME_QUEUE_ARGUMENTS)
+print(f"Publicando en '{exchange or routing_key}' (clave '{routing_key}').")
 
-## ----------------------------------------------------------------
-## CONFIGURACIÓN DE CONEXIÓN SEGURA (TLS)
-## ----------------------------------------------------------------
-ssl_options = None
-if RABBITMQ_PORT == 5671:
-    print("Configurando conexión TLS...")
-    try:
-        context = ssl.create_default_context(cafile=CA_CERT_PATH)
-        context.load_cert_chain(certfile=CLIENT_CERT_PATH, keyfile=CLIENT_KEY_PATH)
-        ssl_options = pika.SSLOptions(context, server_hostname=RABBITMQ_HOST)
-        print("Contexto SSL creado exitosamente.")
-    except Exception as e:
-        print(f"Error fatal creando el contexto SSL: {e}")
-        exit(1)
-
-## ----------------------------------------------------------------
-## LÓGICA DE CONEXIÓN CON REINTENTOS
-## ----------------------------------------------------------------
-connection = None
-attempts = 0
+#Escuchar los mensajes de carga de los nodos de procesamiento
+#Con shards, la carga que cuenta es la del nodo dueño del shard de la cámara
+shard = camera_shard(CAMERA_ID, SHARD_COUNT) if FRAME_ROUTING == 'shard' else None
+rate = AdaptiveRate(MAX_FPS, MIN_FPS, MAX_JPEG_QUALITY, MIN_JPEG_QUALITY, shard=shard)
+publisher = AsyncPublisher(params, PUBLISH_RING_SIZE, PUBLISH_MAX_IN_FLIGHT,
+                           setup=[declare_frames, consume_fanout(CONTROL_EXCHANGE, rate.on_control)])
 print(f"Intentando conectar a RabbitMQ en '{RABBITMQ_HOST}:{RABBITMQ_PORT}'...")
 
-while attempts < 10 and not connection:
-    try:
-        params = pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            ssl_options=ssl_options,
-            credentials=pika.credentials.ExternalCredentials(),
-            heartbeat=600,
-            blocked_connection_timeout=300
-        )
-        connection = pika.BlockingConnection(params)
-        print("¡Conexión exitosa con RabbitMQ!")
-        
-     #Capturar errores específicos de verificación de certificados
-    except (ssl.SSLCertVerificationError, ssl.SSLError) as e:
-        print(f"--- ERROR DE VERIFICACIÓN SSL ---")
-        traceback.print_exc()
-        attempts += 1
-        print(f"Reintentando... (Intento {attempts}/10)")
-        time.sleep(5)
-        
-    #Capturar otros errores de conexión de Pika
-    except pika.exceptions.AMQPConnectionError as e:
-        print(f"--- ERROR DE CONEXIÓN AMQP ---")
-        traceback.print_exc()
-        attempts += 1
-        print(f"Reintentando... (Intento {attempts}/10)")
-        time.sleep(5)
-        
-    #Capturar cualquier otro error
-    except Exception as e:
-        print(f"--- ERROR INESPERADO ---")
-        traceback.print_exc()
-        attempts += 1
-        print(f"Reintentando... (Intento {attempts}/10)")
-        time.sleep(5)
 
-if not connection:
-    print("No se pudo establecer conexión con RabbitMQ después de varios intentos. Saliendo.")
-    exit(1)
+publish_frame = frame_publisher(publisher, CAMERA_ID, exchange, routing_key, LIVE_MODE, FRAME_ENVELOPE)
 
 ## ----------------------------------------------------------------
 ## LÓGICA PRINCIPAL DEL EMISOR
 ## ----------------------------------------------------------------
-try:
-
-    #Conexión a la cola de rabbitmq
-    channel = connection.channel()
-    channel.queue_declare(queue='camera_frames', durable=True)
-    print("Canal y cola 'camera_frames' declarados.")
+#Tres hilos: captura (siempre el último frame), codificación al ritmo del
+#control adaptativo y publicación. El hilo principal solo espera.
+def stop_on_sigterm(signum, frame):
+    raise KeyboardInterrupt
 
-    #Abrir cámara
-    cap = cv2.VideoCapture(CAMERA_INDEX)
-    if not cap.isOpened():
-        raise IOError(f"No se puede abrir la cámara con índice {CAMERA_INDEX}")
 
+signal.signal(signal.SIGTERM, stop_on_sigterm)
+capture = CaptureThread(CAMERA_INDEX, CAMERA_ID)
+encoder = EncoderThread(capture, rate, FRAME_WIDTH, FRAME_HEIGHT, publish_frame, envelope=FRAME_ENVELOPE)
+try:
+    start_metrics_server(METRICS_HOST, METRICS_PORT)
+    print(f"Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    publisher.start()
+    capture.start()
+    encoder.start()
     print("Cámara abierta. Empezando a enviar frames...")
-    while True:
-
-        #Lectura de frames
-        ret, frame = cap.read()
-        if not ret:
-            print("No se pudo leer el frame de la cámara. Terminando bucle.")
-            break
-        
-        #Escribir y codificar el frame a
-        result, buffer = cv2.imencode('.jpg', frame,[int(cv2.IMWRITE_JPEG_QUALITY), 90])
-        if not result:
-            continue
-
-        props = pika.BasicProperties(
-            app_id=CAMERA_ID,
-            delivery_mode=2,
-            content_type='image/jpeg'
-        )
-
-        #Publicar el mensaje
-        channel.basic_publish(
-            exchange='',
-            routing_key='camera_frames',
-            body=buffer.tobytes(),
-            properties=props)
-        
-
-
-        #Controlar la tasa de envío (ej. 10 frames por segundo)
-        time.sleep(0.1)
+    while encoder.is_alive():
+        encoder.thread.join(timeout=1.0)
 
 #Para terminar la conexión
 except KeyboardInterrupt:
@@ -135,8 +63,9 @@ except KeyboardInterrupt:
 except Exception as e:
     print(f"Ocurrió un error en el bucle principal: {e}")
 finally:
-    if connection and not connection.is_closed:
-        print("Cerrando la conexión con RabbitMQ.")
-        connection.close()
-    if 'cap' in locals() and cap.isOpened():
-        cap.release()
\ No newline at end of file
+    if capture.running:
+        capture.stop()
+    if encoder.is_alive():
+        encoder.stop()
+    print("Cerrando la conexión con RabbitMQ.")
+    publisher.stop()
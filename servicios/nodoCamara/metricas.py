@@ -0,0 +1,23 @@
+# --- IMPORTS ---
+#El núcleo (Counter, Gauge, Histogram y el endpoint /metrics) es común a los
+#tres servicios y vive en servicios/comun/metricas.py. La imagen copia comun/ en
+#/opt/servicios y lo pone en PYTHONPATH (ver el Dockerfile); desde el
+#repositorio se corre con PYTHONPATH apuntando a servicios/
+from comun.metricas import Counter, Gauge, Histogram
+
+## ----------------------------------------------------------------
+## MÉTRICAS DEL EMISOR
+## ----------------------------------------------------------------
+FRAMES_PUBLISHED = Counter('frames_published_total', 'Frames publicados y confirmados por RabbitMQ', ['camera'])
+FRAMES_DROPPED = Counter('frames_dropped_total', 'Frames capturados que no llegaron a RabbitMQ', ['camera', 'reason'])
+FRAMES_FAILED = Counter('frames_failed_total', 'Frames que no se pudieron leer o codificar', ['camera', 'reason'])
+FRAME_BYTES = Histogram('frame_bytes', 'Tamaño del JPEG publicado', ['camera'],
+                        buckets=(10000, 20000, 40000, 60000, 80000, 120000, 160000, 250000))
+STAGE_SECONDS = Histogram('stage_seconds', 'Duración de cada etapa del emisor', ['stage'],
+                          buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+TARGET_FPS = Gauge('target_fps', 'FPS de envío elegidos según la carga', ['camera'])
+JPEG_QUALITY = Gauge('jpeg_quality', 'Calidad JPEG elegida según la carga', ['camera'])
+RING_DEPTH = Gauge('publish_ring_depth', 'Frames codificados esperando para publicarse', ['connection'])
+IN_FLIGHT = Gauge('publish_in_flight', 'Frames publicados que esperan la confirmación del broker', ['connection'])
+SOURCE_UP = Gauge('source_up', 'Fuente de video abierta (1) o reconectando (0)', ['camera'])
+PROCESSING_LOAD = Gauge('processing_load', 'Carga más alta reportada por los nodos de procesamiento')
@@ -0,0 +1,319 @@
+# --- IMPORTS ---
+import ssl
+import threading
+import time
+import traceback
+import zlib
+from collections import deque
+
+import pika
+
+from comun import sobre
+import metricas
+
+## ----------------------------------------------------------------
+## PUBLICADOR ASÍNCRONO CON CONFIRMACIONES
+## ----------------------------------------------------------------
+#Un hilo propio con una SelectConnection de pika. publish() solo deja el
+#mensaje en un anillo acotado y despierta al hilo; si el anillo está lleno se
+#descarta el frame más viejo ('ring_full'), que en video en vivo ya no sirve.
+#El hilo publica con confirmaciones del broker (publisher confirms) y deja como
+#máximo max_in_flight mensajes sin confirmar: si RabbitMQ se pone lento, el
+#que espera es el anillo, no la cámara. Si la conexión se cae, se reconecta
+#con espera exponencial y los frames sin confirmar se cuentan como perdidos
+#('unconfirmed'); no se reenvían porque ya son viejos.
+
+
+FRAMES_QUEUE = 'camera_frames'
+#En modo en vivo la cola lleva límites (x-max-length, TTL); RabbitMQ no deja
+#redeclarar una cola existente con otros argumentos, así que es otra cola
+LIVE_FRAMES_QUEUE = 'camera_frames.live'
+FRAMES_EXCHANGE = 'camera_frames.shards'
+
+
+def connection_params(host, port, ca_cert, client_cert, client_key):
+    #Parámetros de conexión; en el puerto 5671 con TLS y certificado de cliente
+    ssl_options = None
+    if port == 5671:
+        print("Configurando conexión TLS...")
+        context = ssl.create_default_context(cafile=ca_cert)
+        context.load_cert_chain(certfile=client_cert, keyfile=client_key)
+        ssl_options = pika.SSLOptions(context, server_hostname=host)
+        print("Contexto SSL creado exitosamente.")
+    return pika.ConnectionParameters(
+        host=host,
+        port=port,
+        ssl_options=ssl_options,
+        credentials=pika.credentials.ExternalCredentials(),
+        heartbeat=600,
+        blocked_connection_timeout=300
+    )
+
+
+def camera_shard(camera_id, shard_count):
+    #El mismo reparto que coordinador.shard_for en el nodo de procesamiento
+    return zlib.crc32(camera_id.encode('utf-8')) % shard_count
+
+
+def frame_route(camera_id, routing, shard_count, queue_arguments):
+    #Devuelve (exchange, routing_key, declaración) para los frames de una cámara.
+    #'shard': exchange de shards con la clave del shard de la cámara, para que
+    #siempre la procese el mismo nodo; 'queue': la cola camera_frames (o
+    #camera_frames.live si viene con queue_arguments).
+    if routing == 'shard':
+        routing_key = f"shard.{camera_shard(camera_id, shard_count)}"
+        return FRAMES_EXCHANGE, routing_key, declare_exchange(FRAMES_EXCHANGE, 'direct', durable=True)
+    queue = LIVE_FRAMES_QUEUE if queue_arguments else FRAMES_QUEUE
+    return '', queue, declare_queue(queue, durable=True, arguments=queue_arguments)
+
+
+def frame_publisher(publisher, camera_id, exchange, routing_key, live, envelope):
+    #Devuelve publish(body, capture_ts) para el EncoderThread de una cámara.
+    #live: mensajes no persistentes; envelope: el cuerpo ya es un sobre
+    def publish(body, capture_ts):
+        props = pika.BasicProperties(
+            app_id=camera_id,
+            delivery_mode=1 if live else 2,
+            content_type=sobre.CONTENT_TYPE if envelope else 'image/jpeg',
+            #Con sobre la hora de captura ya va en el cuerpo; el header es para
+            #los nodos viejos que reciben el JPEG solo
+            headers=None if envelope else {'capture_ts': capture_ts}
+        )
+        publisher.publish(exchange, routing_key, body, props, camera_id)
+    return publish
+
+
+def declare_exchange(name, exchange_type, durable=False):
+    def op(channel, done):
+        channel.exchange_declare(exchange=name, exchange_type=exchange_type, durable=durable,
+                                 callback=lambda _: done())
+    return op
+
+
+def declare_queue(name, durable=True, arguments=None):
+    def op(channel, done):
+        channel.queue_declare(queue=name, durable=durable, arguments=arguments, callback=lambda _: done())
+    return op
+
+
+def consume_fanout(exchange, on_message):
+    #Cola exclusiva enlazada a un exchange fanout (mensajes de control)
+    def op(channel, done):
+        def on_exchange(_):
+            channel.queue_declare(queue='', exclusive=True, callback=on_queue)
+
+        def on_queue(frame):
+            queue = frame.method.queue
+            channel.queue_bind(queue=queue, exchange=exchange, callback=lambda _: on_bound(queue))
+
+        def on_bound(queue):
+            channel.basic_consume(queue=queue, on_message_callback=on_message, auto_ack=True)
+            done()
+
+        channel.exchange_declare(exchange=exchange, exchange_type='fanout', callback=on_exchange)
+    return op
+
+
+class OutgoingMessage:
+    __slots__ = ('exchange', 'routing_key', 'body', 'properties', 'camera_id', 'queued_at')
+
+    def __init__(self, exchange, routing_key, body, properties, camera_id):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.camera_id = camera_id
+        self.queued_at = time.perf_counter()
+
+
+class AsyncPublisher:
+    RECONNECT_MIN_SECONDS = 1.0
+    RECONNECT_MAX_SECONDS = 30.0
+
+    def __init__(self, params, ring_size, max_in_flight, setup=(), name='0'):
+        #setup: operaciones op(channel, done) que se corren en orden al abrir
+        #cada canal (declarar colas/exchanges, consumir el control).
+        #name identifica la conexión en las métricas cuando hay un pool.
+        self.params = params
+        self.name = name
+        self.ring_size = ring_size
+        self.max_in_flight = max_in_flight
+        self.setup = list(setup)
+        self.ring = deque()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.channel = None
+        self.ready = False
+        self.wake_pending = False
+        #delivery_tag -> (camera_id, momento de publicación), en orden
+        self.in_flight = {}
+        self.next_tag = 0
+        self.backoff = self.RECONNECT_MIN_SECONDS
+        self.stopping = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'publisher-{name}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def publish(self, exchange, routing_key, body, properties, camera_id):
+        #Se puede llamar desde cualquier hilo; nunca bloquea
+        message = OutgoingMessage(exchange, routing_key, body, properties, camera_id)
+        with self.lock:
+            if len(self.ring) >= self.ring_size:
+                dropped = self.ring.popleft()
+                metricas.FRAMES_DROPPED.inc(dropped.camera_id, 'ring_full')
+            self.ring.append(message)
+            metricas.RING_DEPTH.set(len(self.ring), self.name)
+        self._wakeup()
+
+    def pending(self):
+        with self.lock:
+            return len(self.ring) + len(self.in_flight)
+
+    def stop(self, timeout=5.0):
+        #Da hasta timeout segundos para vaciar el anillo y recibir las
+        #confirmaciones pendientes, y después cierra
+        deadline = time.monotonic() + timeout
+        while self.ready and self.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.stopping = True
+        self.stopped.set()
+        connection = self.connection
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close)
+            except Exception:
+                pass
+        self.thread.join(timeout)
+
+    ## --- Hilo del publicador ---
+    def _run(self):
+        while not self.stopping:
+            self.connection = pika.SelectConnection(
+                self.params,
+                on_open_callback=self._on_open,
+                on_open_error_callback=self._on_open_error,
+                on_close_callback=self._on_closed)
+            #Corre hasta que la conexión se cierra (por error o por stop)
+            try:
+                self.connection.ioloop.start()
+            except Exception:
+                #Un callback falló: el hilo no puede morir en silencio, porque
+                #el emisor dejaría de publicar. Se cierra y se reconecta
+                print(f"--- [{self.name}] Error en el hilo del publicador: ---")
+                traceback.print_exc()
+                self._abort()
+            self._lost()
+            if not self.stopping:
+                print(f"[{self.name}] Reconectando con RabbitMQ en {self.backoff:.0f} s...")
+                self.stopped.wait(self.backoff)
+                self.backoff = min(self.backoff * 2, self.RECONNECT_MAX_SECONDS)
+
+    def _abort(self):
+        #Cierra la conexión después de que el ioloop salió por una excepción;
+        #_on_closed lo vuelve a detener cuando termina el cierre
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+                self.connection.ioloop.start()
+        except Exception:
+            traceback.print_exc()
+
+    def _wakeup(self):
+        connection = self.connection
+        if connection is None or self.wake_pending:
+            return
+        self.wake_pending = True
+        try:
+            connection.ioloop.add_callback_threadsafe(self._drain)
+        except Exception:
+            #La conexión se está cerrando: se vacía al reconectar
+            self.wake_pending = False
+
+    def _close(self):
+        if self.connection.is_open:
+            self.connection.close()
+        elif not self.connection.is_closed:
+            self.connection.ioloop.stop()
+
+    def _on_open(self, connection):
+        print("¡Conexión exitosa con RabbitMQ!")
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_open_error(self, connection, error):
+        print(f"--- ERROR DE CONEXIÓN AMQP: {error!r} ---")
+        connection.ioloop.stop()
+
+    def _on_closed(self, connection, reason):
+        if not self.stopping:
+            print(f"Conexión con RabbitMQ cerrada: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(ack_nack_callback=self._on_confirm, callback=lambda _: self._run_setup(0))
+
+    def _on_channel_closed(self, channel, reason):
+        self.ready = False
+        if self.connection.is_open:
+            print(f"Canal cerrado por RabbitMQ: {reason}")
+            self.connection.close()
+
+    def _run_setup(self, index):
+        if index < len(self.setup):
+            self.setup[index](self.channel, lambda: self._run_setup(index + 1))
+            return
+        self.ready = True
+        self.backoff = self.RECONNECT_MIN_SECONDS
+        self._drain()
+
+    def _drain(self):
+        #Publica desde el anillo mientras haya lugar en la ventana de confirmaciones
+        self.wake_pending = False
+        while self.ready and len(self.in_flight) < self.max_in_flight:
+            with self.lock:
+                if not self.ring:
+                    break
+                message = self.ring.popleft()
+                metricas.RING_DEPTH.set(len(self.ring), self.name)
+            self.channel.basic_publish(exchange=message.exchange, routing_key=message.routing_key,
+                                       body=message.body, properties=message.properties)
+            now = time.perf_counter()
+            metricas.STAGE_SECONDS.observe(now - message.queued_at, 'publish')
+            self.next_tag += 1
+            with self.lock:
+                self.in_flight[self.next_tag] = (message.camera_id, now)
+        metricas.IN_FLIGHT.set(len(self.in_flight), self.name)
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        now = time.perf_counter()
+        with self.lock:
+            if method.multiple:
+                tags = [tag for tag in self.in_flight if tag <= method.delivery_tag]
+            else:
+                tags = [method.delivery_tag] if method.delivery_tag in self.in_flight else []
+            confirmed = [self.in_flight.pop(tag) for tag in tags]
+        for camera_id, published_at in confirmed:
+            if acked:
+                metricas.FRAMES_PUBLISHED.inc(camera_id)
+                metricas.STAGE_SECONDS.observe(now - published_at, 'confirm')
+            else:
+                metricas.FRAMES_DROPPED.inc(camera_id, 'nacked')
+        self._drain()
+
+    def _lost(self):
+        #Lo que quedó sin confirmar en la conexión anterior no se reenvía
+        self.ready = False
+        self.wake_pending = False
+        self.channel = None
+        with self.lock:
+            lost = list(self.in_flight.values())
+            self.in_flight.clear()
+        for camera_id, _ in lost:
+            metricas.FRAMES_DROPPED.inc(camera_id, 'unconfirmed')
+        self.next_tag = 0
+        metricas.IN_FLIGHT.set(0, self.name)
@@ -0,0 +1,146 @@
+# --- IMPORTS ---
+import math
+import signal
+import time
+
+from adaptacion import CONTROL_EXCHANGE, AdaptiveRate
+from captura import CaptureThread, EncoderThread
+from config import (CA_CERT_PATH, CLIENT_CERT_PATH, CLIENT_KEY_PATH, FRAME_ENVELOPE, FRAME_HEIGHT,
+                    FRAME_QUEUE_ARGUMENTS, FRAME_ROUTING, FRAME_WIDTH, LIVE_MODE, MAX_FPS, MAX_JPEG_QUALITY,
+                    METRICS_HOST, METRICS_PORT, MIN_FPS, MIN_JPEG_QUALITY, PUBLISH_MAX_IN_FLIGHT,
+                    PUBLISH_RING_SIZE, RABBITMQ_HOST, RABBITMQ_PORT, SHARD_COUNT,
+                    SOURCE_RECONNECT_MAX_SECONDS, STREAMS_FILE, STREAMS_PER_CONNECTION, load_streams)
+from comun.metricas import start_metrics_server
+import metricas
+from publicador import (AsyncPublisher, camera_shard, connection_params, consume_fanout, frame_publisher,
+                        frame_route)
+
+## ----------------------------------------------------------------
+## VARIAS CÁMARAS EN UN SOLO PROCESO
+## ----------------------------------------------------------------
+#Igual que emisor.py pero para todas las fuentes de STREAMS_FILE (dispositivos,
+#URLs RTSP/HTTP o archivos de video). Cada cámara tiene su hilo de captura,
+#su hilo de codificación y su propio control adaptativo; las conexiones a
+#RabbitMQ se comparten: un pool de ceil(cámaras / STREAMS_PER_CONNECTION)
+#publicadores asíncronos y cada cámara publica siempre por el mismo. Si una
+#fuente se cae, su hilo de captura la reabre con espera exponencial sin
+#afectar a las demás; si se cae una conexión, el publicador se reconecta solo.
+STATUS_INTERVAL = 30.0
+
+
+class Stream:
+    def __init__(self, config, publisher):
+        self.camera_id = config['id']
+        self.publisher = publisher
+        shard = camera_shard(self.camera_id, SHARD_COUNT) if FRAME_ROUTING == 'shard' else None
+        self.rate = AdaptiveRate(float(config.get('max_fps', MAX_FPS)), MIN_FPS, MAX_JPEG_QUALITY, MIN_JPEG_QUALITY,
+                                 shard=shard)
+        self.exchange, self.routing_key, self.declare = frame_route(self.camera_id, FRAME_ROUTING, SHARD_COUNT,
+                                                                    FRAME_QUEUE_ARGUMENTS)
+        self.publish = frame_publisher(publisher, self.camera_id, self.exchange, self.routing_key, LIVE_MODE,
+                                       FRAME_ENVELOPE)
+        self.capture = CaptureThread(config['source'], self.camera_id, reconnect=True,
+                                     loop=bool(config.get('loop', False)),
+                                     reconnect_max_seconds=SOURCE_RECONNECT_MAX_SECONDS)
+        self.encoder = EncoderThread(self.capture, self.rate, FRAME_WIDTH, FRAME_HEIGHT, self.publish,
+                                     envelope=FRAME_ENVELOPE)
+
+    def start(self):
+        self.capture.start()
+        self.encoder.start()
+
+    def stop(self):
+        if self.capture.running:
+            self.capture.stop()
+        if self.encoder.is_alive():
+            self.encoder.stop()
+
+
+def control_fanout(streams):
+    #Cada conexión recibe los mensajes de carga y los reparte a sus cámaras
+    def on_control(ch, method, properties, body):
+        for stream in streams:
+            stream.rate.on_control(ch, method, properties, body)
+    return consume_fanout(CONTROL_EXCHANGE, on_control)
+
+
+def build_pool(configs, params):
+    #Devuelve (publicadores, cámaras). La cámara i usa el publicador i % n y el
+    #anillo de cada publicador crece con la cantidad de cámaras que lleva.
+    size = max(1, math.ceil(len(configs) / STREAMS_PER_CONNECTION))
+    groups = [configs[i::size] for i in range(size)]
+    publishers, streams = [], []
+    for n, group in enumerate(groups):
+        publisher = AsyncPublisher(params, PUBLISH_RING_SIZE * len(group), PUBLISH_MAX_IN_FLIGHT * len(group),
+                                   name=str(n))
+        group_streams = [Stream(config, publisher) for config in group]
+        #Declaraciones sin repetir (con 'shard' todas usan el mismo exchange)
+        declares = {s.exchange or s.routing_key: s.declare for s in group_streams}
+        publisher.setup = list(declares.values()) + [control_fanout(group_streams)]
+        publishers.append(publisher)
+        streams.extend(group_streams)
+    return publishers, streams
+
+
+## ----------------------------------------------------------------
+## LÓGICA PRINCIPAL
+## ----------------------------------------------------------------
+def stop_on_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    try:
+        configs = load_streams(STREAMS_FILE)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error leyendo las cámaras de '{STREAMS_FILE}': {e}")
+        exit(1)
+    if not configs:
+        print(f"No hay cámaras en '{STREAMS_FILE}'.")
+        exit(1)
+
+    try:
+        params = connection_params(RABBITMQ_HOST, RABBITMQ_PORT, CA_CERT_PATH, CLIENT_CERT_PATH, CLIENT_KEY_PATH)
+    except Exception as e:
+        print(f"Error fatal creando el contexto SSL: {e}")
+        exit(1)
+
+    publishers, streams = build_pool(configs, params)
+    print(f"{len(streams)} cámaras en {len(publishers)} conexiones a '{RABBITMQ_HOST}:{RABBITMQ_PORT}'.")
+
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    try:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+        print(f"Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        for publisher in publishers:
+            publisher.start()
+        for stream in streams:
+            stream.start()
+            print(f"Cámara '{stream.camera_id}' iniciada (clave '{stream.routing_key}').")
+
+        #Solo terminan por su cuenta las fuentes que no se reconectan
+        #(archivos sin loop); el proceso sigue mientras quede alguna
+        next_status = time.monotonic() + STATUS_INTERVAL
+        while any(stream.encoder.is_alive() for stream in streams):
+            time.sleep(1.0)
+            if time.monotonic() >= next_status:
+                up = sum(1 for stream in streams if metricas.SOURCE_UP.get(stream.camera_id))
+                pending = sum(publisher.pending() for publisher in publishers)
+                print(f"Cámaras activas: {up}/{len(streams)}, frames pendientes: {pending}")
+                next_status += STATUS_INTERVAL
+
+    #Para terminar la conexión
+    except KeyboardInterrupt:
+        print("Interrupción por teclado detectada. Cerrando cámaras.")
+    except Exception as e:
+        print(f"Ocurrió un error en el bucle principal: {e}")
+    finally:
+        for stream in streams:
+            stream.stop()
+        print("Cerrando las conexiones con RabbitMQ.")
+        for publisher in publishers:
+            publisher.stop()
+
+
+if __name__ == '__main__':
+    main()
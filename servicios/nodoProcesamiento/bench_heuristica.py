@@ -0,0 +1,149 @@
+# --- IMPORTS ---
+import argparse
+import itertools
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from heuristica import alert_reasons, velocity_alerts
+from seguimiento import TrackTable
+
+## ----------------------------------------------------------------
+## MICRO-BENCHMARK DE LA HEURÍSTICA DE AGRESIÓN
+## ----------------------------------------------------------------
+#Compara el bucle por pares original con el camino que usa sesiones.py
+#(TrackTable.update + heuristica.velocity_alerts + heuristica.alert_reasons)
+#para escenas de 2 a 200 personas en un frame de 640x480, y el
+#costo por frame del estado de tracks (defaultdict con barrido completo contra
+#seguimiento.TrackTable) cuando los IDs se renuevan rápido.
+#Uso: python bench_heuristica.py [--repeats 200]
+
+SPEED_THRESHOLD = 50
+PROXIMITY_THRESHOLD = 50
+VIDEO_FPS = 10
+TRACK_HISTORY = 8
+TRACK_VELOCITY_TAU = 0.2
+SIZES = [2, 5, 10, 20, 40, 80, 120, 200]
+#IDs nuevos por frame con 10 personas en escena, a 10 fps y 5 s de vencimiento
+CHURN = [0, 1, 5, 10, 20]
+#Pasadas por nivel de churn; se queda la mejor (menos ruido de la máquina)
+CHURN_RUNS = 5
+TRACK_STALE_SECONDS = 5
+
+
+def legacy_alerts(ids, centers, last_centers, has_last):
+    #Copia de la lógica que había en el callback de procesamiento.py
+    alert_ids = set()
+    positions = {}
+    for track_id, pos, last_pos, known in zip(ids, centers, last_centers, has_last):
+        positions[track_id] = tuple(pos)
+        if known:
+            distance = np.linalg.norm(np.array(pos) - np.array(last_pos))
+            if distance > SPEED_THRESHOLD:
+                alert_ids.add(track_id)
+
+    detected_ids = list(positions.keys())
+    for i in range(len(detected_ids)):
+        for j in range(i + 1, len(detected_ids)):
+            id1, id2 = detected_ids[i], detected_ids[j]
+            distance = np.linalg.norm(np.array(positions[id1]) - np.array(positions[id2]))
+            if distance < PROXIMITY_THRESHOLD:
+                alert_ids.add(id1)
+                alert_ids.add(id2)
+    return alert_ids
+
+
+def production_alerts(table, ids, centers, clock):
+    #Lo mismo que CameraSession.analyze: velocidad suavizada en la tabla de
+    #tracks y las dos reglas de heuristica.py. clock da el número de frame
+    now = next(clock) / VIDEO_FPS
+    speeds, has_velocity = table.update(ids, centers, now)
+    fast = velocity_alerts(speeds, has_velocity, SPEED_THRESHOLD * VIDEO_FPS)
+    return alert_reasons(ids, centers, fast, PROXIMITY_THRESHOLD)
+
+
+def make_scene(n, rng):
+    ids = np.arange(1, n + 1)
+    centers = np.column_stack([rng.integers(0, 640, n), rng.integers(0, 480, n)])
+    last_centers = centers + rng.integers(-60, 61, size=(n, 2))
+    has_last = rng.random(n) > 0.1
+    return ids, centers, last_centers, has_last
+
+
+def measure(fn, args, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+
+def legacy_tracks(frames):
+    #Copia del estado anterior de sesiones.py: actualizar y barrer todo el dict
+    tracked_people = defaultdict(lambda: {'last_pos': None, 'last_time': None})
+    for ids, centers, now in frames:
+        for track_id, center in zip(ids.tolist(), centers.tolist()):
+            tracked_people[track_id]['last_pos'] = center
+            tracked_people[track_id]['last_time'] = now
+        stale_ids = [tid for tid, data in tracked_people.items() if now - data['last_time'] > TRACK_STALE_SECONDS]
+        for tid in stale_ids:
+            del tracked_people[tid]
+
+
+def table_tracks(frames):
+    table = TrackTable(256, TRACK_HISTORY, TRACK_STALE_SECONDS, TRACK_VELOCITY_TAU)
+    for ids, centers, now in frames:
+        table.update(ids, centers, now)
+        table.expire(now)
+
+
+def make_churn(churn, count, rng):
+    frames, first = [], 0
+    for n in range(count):
+        frames.append((np.arange(first, first + 10), rng.uniform(0, 640, (10, 2)), n * 0.1))
+        first += churn
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la heurística de agresión")
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'personas':>8} {'bucle (us)':>12} {'producción (us)':>17} {'aceleración':>12}")
+    for n in SIZES:
+        ids, centers, last_centers, has_last = make_scene(n, rng)
+
+        #La regla de velocidad cambió (velocidad suavizada en vez del salto de
+        #un frame); la de proximidad tiene que dar lo mismo que el bucle
+        expected = legacy_alerts(ids.tolist(), centers.tolist(), last_centers.tolist(), [False] * n)
+        table = TrackTable(max(n, 1), TRACK_HISTORY, TRACK_STALE_SECONDS, TRACK_VELOCITY_TAU)
+        table.update(ids, last_centers, 0.0)
+        clock = itertools.count(1)
+        got = production_alerts(table, ids, centers, clock)
+        if expected != {tid for tid, names in got.items() if 'proximity' in names}:
+            raise SystemExit(f"Proximidad distinta con {n} personas")
+
+        legacy_us = measure(
+            legacy_alerts,
+            (ids.tolist(), centers.tolist(), last_centers.tolist(), has_last.tolist()),
+            args.repeats)
+        fast_us = measure(
+            production_alerts,
+            (table, ids, centers, clock),
+            args.repeats)
+        print(f"{n:>8} {legacy_us:>12.1f} {fast_us:>17.1f} {legacy_us / fast_us:>11.1f}x")
+
+    frames_count = 2000
+    print(f"\n{'ids nuevos/frame':>16} {'dict (us/frame)':>16} {'TrackTable (us/frame)':>22}")
+    for churn in CHURN:
+        frames = make_churn(churn, frames_count, rng)
+        legacy_us = min(measure(legacy_tracks, (frames,), 1) for _ in range(CHURN_RUNS)) / frames_count
+        table_us = min(measure(table_tracks, (frames,), 1) for _ in range(CHURN_RUNS)) / frames_count
+        print(f"{churn:>16} {legacy_us:>16.1f} {table_us:>22.1f}")
+
+
+if __name__ == '__main__':
+    main()
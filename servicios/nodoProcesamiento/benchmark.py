@@ -0,0 +1,221 @@
+# --- IMPORTS ---
+import argparse
+import glob
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import (BATCH_MAX_SIZE, DETECTOR_BACKEND, DETECTOR_CONF, DETECTOR_IMGSZ, DETECTOR_IOU,
+                    DETECTOR_THREADS, MODEL_CACHE_DIR, MODEL_WEIGHTS, PIPELINE_CAPACITY, PRE_EVENT_BUFFER_SIZE,
+                    SESSION_IDLE_SECONDS, VIDEO_FPS, VIDEO_HEIGHT, VIDEO_WIDTH)
+from detectores import BACKENDS, load_detector
+import metricas
+from pipeline import Pipeline
+from sesiones import SessionManager
+
+## ----------------------------------------------------------------
+## REPRODUCCIÓN OFFLINE Y BENCHMARK DEL PIPELINE
+## ----------------------------------------------------------------
+#Pasa un video grabado o una carpeta de JPEG por el mismo pipeline que
+#procesamiento.py (decodificar -> inferir -> tracking/heurística -> grabar),
+#sin RabbitMQ ni ventanas. N cámaras simuladas envían el mismo material; un
+#semáforo con PIPELINE_CAPACITY permisos hace de prefetch del broker.
+#
+#Uso:
+#  python benchmark.py --source video.mp4 --cameras 4
+#  python benchmark.py --source carpeta_jpg/ --cameras 8 --fps 10 --json base.json
+#  python benchmark.py --source video.mp4 --cameras 4 --fps 10 --live   (con descartes, como en vivo)
+#  python benchmark.py --source video.mp4 --backend onnx --imgsz 416 --threads 4
+#
+#Con --fps 0 (por defecto) las cámaras envían lo más rápido posible y el
+#resultado es el máximo de frames/s; con --fps N cada cámara va a su ritmo real.
+#Sin --live no se descarta ningún frame, sea cual sea LIVE_MODE.
+#
+#Latencias: cada etapa sin las esperas en colas (decode, infer del lote, track,
+#heuristic, record) y total desde que se envía el frame hasta el ack. record
+#solo cuenta frames con clip abierto; track y heuristic, solo los inferidos.
+STAGES = ('decode', 'infer', 'track', 'heuristic', 'record', 'total')
+JPEG_QUALITY = 85
+
+
+def load_frames(source, limit):
+    #Devuelve los frames como JPEG del tamaño de trabajo, igual que el emisor
+    if os.path.isdir(source):
+        paths = sorted(p for ext in ('*.jpg', '*.jpeg', '*.png') for p in glob.glob(os.path.join(source, ext)))
+        images = (cv2.imread(p) for p in paths)
+    else:
+        capture = cv2.VideoCapture(source)
+
+        def read_video():
+            while True:
+                ok, image = capture.read()
+                if not ok:
+                    break
+                yield image
+            capture.release()
+        images = read_video()
+
+    frames = []
+    for image in images:
+        if image is None:
+            continue
+        if image.shape[1] != VIDEO_WIDTH or image.shape[0] != VIDEO_HEIGHT:
+            image = cv2.resize(image, (VIDEO_WIDTH, VIDEO_HEIGHT), interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+        if ok:
+            frames.append(jpeg.tobytes())
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+def make_detector(args):
+    #Igual que procesamiento.py: solo la clase persona, con el modelo calentado
+    started = time.perf_counter()
+    detector = load_detector(args.backend, args.model, args.imgsz, args.threads, DETECTOR_CONF, DETECTOR_IOU,
+                             MODEL_CACHE_DIR)
+    loaded = time.perf_counter() - started
+    warmup = detector.warmup(VIDEO_WIDTH, VIDEO_HEIGHT, sorted({1, BATCH_MAX_SIZE}))
+    return detector, loaded, warmup
+
+
+class Recorder:
+    #on_done del pipeline: guarda las latencias de cada frame terminado
+    #y devuelve el permiso de "prefetch"
+
+    def __init__(self, permits):
+        self.permits = permits
+        self.lock = threading.Lock()
+        self.samples = {stage: [] for stage in STAGES}
+        self.finished = 0
+
+    def on_done(self, job):
+        with self.lock:
+            self.finished += 1
+            if job.inferred_at is not None:
+                for stage, seconds in job.stages.items():
+                    self.samples[stage].append(seconds)
+                self.samples['total'].append(job.finished_at - job.submitted_at)
+        self.permits.release()
+
+
+def feed(pipeline, permits, frames, cameras, fps, repeat):
+    #Las cámaras se intercalan frame a frame; con fps > 0 se respeta el ritmo
+    interval = 1.0 / fps if fps > 0 else 0.0
+    start = time.perf_counter()
+    sent = 0
+    for n in range(len(frames) * repeat):
+        if interval:
+            delay = start + n * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        body = frames[n % len(frames)]
+        for camera in range(cameras):
+            permits.acquire()
+            pipeline.submit(f"bench-{camera}", body, None, captured_at=time.time(), seq=n + 1)
+            sent += 1
+    return sent
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None}
+    ms = np.percentile(np.asarray(values) * 1000.0, [50, 95, 99])
+    return {'p50': round(float(ms[0]), 2), 'p95': round(float(ms[1]), 2), 'p99': round(float(ms[2]), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline de procesamiento")
+    parser.add_argument('--source', required=True, help="video o carpeta con imágenes")
+    parser.add_argument('--cameras', type=int, default=1)
+    parser.add_argument('--max-frames', type=int, default=300, help="frames a cargar del material")
+    parser.add_argument('--repeat', type=int, default=1, help="veces que se repite el material")
+    parser.add_argument('--fps', type=float, default=0, help="ritmo por cámara (0 = lo más rápido posible)")
+    parser.add_argument('--model', default=MODEL_WEIGHTS)
+    parser.add_argument('--backend', default=DETECTOR_BACKEND, choices=BACKENDS)
+    parser.add_argument('--imgsz', type=int, default=DETECTOR_IMGSZ, help="lado de entrada del modelo")
+    parser.add_argument('--threads', type=int, default=DETECTOR_THREADS, help="hilos de inferencia (0 = del runtime)")
+    parser.add_argument('--output', default=None, help="carpeta para los clips (por defecto una temporal)")
+    parser.add_argument('--json', default=None, help="guardar el resultado en este archivo")
+    parser.add_argument('--live', action='store_true',
+                        help="descartar frames viejos o superados como en vivo")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.max_frames)
+    if not frames:
+        print(f"--- [BENCHMARK] No se pudieron leer frames de {args.source} ---")
+        return
+    print(f"--- [BENCHMARK] {len(frames)} frames cargados, {args.cameras} cámaras. ---")
+
+    detector, load_seconds, warmup_seconds = make_detector(args)
+    print(f"--- [BENCHMARK] Modelo {args.backend} ({args.imgsz}px) cargado en {load_seconds:.1f} s, "
+          f"calentado en {warmup_seconds:.1f} s. ---")
+    sessions = SessionManager(SESSION_IDLE_SECONDS, fps=VIDEO_FPS, width=VIDEO_WIDTH, height=VIDEO_HEIGHT,
+                              buffer_size=PRE_EVENT_BUFFER_SIZE)
+    permits = threading.Semaphore(PIPELINE_CAPACITY)
+    recorder = Recorder(permits)
+    incidents = []
+    output_dir = args.output or tempfile.mkdtemp(prefix='bench-clips-')
+    pipeline = Pipeline(detector, sessions, recorder.on_done,
+                        publish_alert=lambda camera_id, message: incidents.append(message),
+                        output_dir=output_dir, live=args.live)
+
+    pipeline.start()
+    start = time.perf_counter()
+    sent = feed(pipeline, permits, frames, args.cameras, args.fps, args.repeat)
+    pipeline.stop()
+    elapsed = time.perf_counter() - start
+    pipeline.incidents.close_all()
+    sessions.close_all()
+    pipeline.recorder.shutdown()
+
+    processed = sum(metricas.FRAMES_PROCESSED.snapshot().values())
+    skipped = sum(metricas.FRAMES_SKIPPED.snapshot().values())
+    dropped = {}
+    for (camera, reason), count in metricas.FRAMES_DROPPED.snapshot().items():
+        dropped[reason] = dropped.get(reason, 0) + count
+    #ru_maxrss está en KB en Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    result = {
+        'source': args.source,
+        'cameras': args.cameras,
+        'backend': args.backend,
+        'imgsz': args.imgsz,
+        'threads': args.threads,
+        'live_mode': args.live,
+        'load_seconds': round(load_seconds, 2),
+        'warmup_seconds': round(warmup_seconds, 2),
+        'frames_sent': sent,
+        'frames_processed': processed,
+        'frames_motion_skipped': skipped,
+        'frames_dropped': dropped,
+        'seconds': round(elapsed, 3),
+        'fps': round((processed + skipped) / elapsed, 2),
+        'inferred_fps': round(processed / elapsed, 2),
+        'latency_ms': {stage: percentiles(recorder.samples[stage]) for stage in STAGES},
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'incident_events': len(incidents),
+        'clips_dir': output_dir,
+    }
+
+    print(f"--- [BENCHMARK] {sent} frames en {elapsed:.2f} s: {result['fps']} fps "
+          f"({result['inferred_fps']} inferidos/s), descartados {dropped or 0} ---")
+    print(f"{'etapa':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, p in result['latency_ms'].items():
+        print(f"{stage:<10}{p['p50']!s:>10}{p['p95']!s:>10}{p['p99']!s:>10}")
+    print(f"--- [BENCHMARK] RSS máximo: {result['peak_rss_mb']} MB ---")
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(result, out, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# --- IMPORTS ---
+import threading
+from collections import deque
+
+import numpy as np
+
+## ----------------------------------------------------------------
+## BÚFERES DE FRAMES REUTILIZABLES POR CÁMARA
+## ----------------------------------------------------------------
+#Cada cámara tiene un pequeño anillo de arreglos BGR del tamaño de trabajo. La
+#decodificación redimensiona directamente dentro de uno (cv2.resize con dst) y
+#el frame lo devuelve al terminar todas las etapas. Los arreglos se crean la
+#primera vez que hacen falta, hasta `slots`; si todos están en uso acquire()
+#devuelve None y cv2.resize(dst=None) crea un arreglo nuevo, que no vuelve al
+#anillo (el pipeline solo libera los slots que no son None).
+
+
+class FramePool:
+    def __init__(self, width, height, slots):
+        self.shape = (height, width, 3)
+        self.slots = slots
+        self.created = 0
+        self.free = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.free:
+                return self.free.popleft()
+            if self.created < self.slots:
+                self.created += 1
+            else:
+                return None
+        return np.empty(self.shape, dtype=np.uint8)
+
+    def release(self, slot):
+        with self.lock:
+            if len(self.free) < self.slots:
+                self.free.append(slot)
+
+    def clear(self):
+        with self.lock:
+            self.free.clear()
+            self.created = 0
+
+
+class Canvas:
+    #Lienzo reutilizable donde se dibujan las anotaciones; el frame original
+    #queda limpio y puede volver al anillo apenas se usa.
+
+    def __init__(self):
+        self.image = None
+
+    def draw_from(self, frame):
+        if self.image is None or self.image.shape != frame.shape:
+            self.image = np.empty_like(frame)
+        np.copyto(self.image, frame)
+        return self.image
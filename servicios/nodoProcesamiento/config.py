@@ -0,0 +1,142 @@
+# --- IMPORTS ---
+import os
+import socket
+
+## ----------------------------------------------------------------
+## PARÁMETROS DEL NODO DE PROCESAMIENTO
+## ----------------------------------------------------------------
+#Parámetros para el modelo
+SPEED_THRESHOLD = 50
+PROXIMITY_THRESHOLD = 50
+
+#Detector (ver detectores.py). DETECTOR_BACKEND: 'ultralytics' (PyTorch),
+#'onnx' (ONNX Runtime) u 'openvino'; los dos últimos exportan MODEL_WEIGHTS
+#una vez a MODEL_CACHE_DIR y lo reutilizan en los siguientes arranques.
+#DETECTOR_IMGSZ es el lado de entrada del modelo (múltiplo de 32; 320 o 416
+#es bastante más rápido que 640 en CPU) y DETECTOR_THREADS los hilos de la
+#inferencia (0 = lo que elija el runtime).
+DETECTOR_BACKEND = os.getenv('DETECTOR_BACKEND', 'ultralytics')
+MODEL_WEIGHTS = os.getenv('MODEL_WEIGHTS', 'yolov8n.pt')
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', 'models')
+DETECTOR_IMGSZ = int(os.getenv('DETECTOR_IMGSZ', 640))
+DETECTOR_THREADS = int(os.getenv('DETECTOR_THREADS', 0))
+DETECTOR_CONF = float(os.getenv('DETECTOR_CONF', 0.25))
+DETECTOR_IOU = float(os.getenv('DETECTOR_IOU', 0.7))
+
+#Parámetros de la inferencia en lote (varias cámaras por llamada al modelo)
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 50))
+
+# Parámetros del video a guardar
+VIDEO_FPS = 10.0
+VIDEO_WIDTH = 640
+VIDEO_HEIGHT = 480
+RECORDING_SECONDS = 5
+OUTPUT_DIR = 'output'
+
+#Grabador en segundo plano: frames en cola por clip y duración máxima de un
+#clip que se va extendiendo con alertas nuevas
+CLIP_QUEUE_SIZE = int(os.getenv('CLIP_QUEUE_SIZE', 64))
+MAX_CLIP_SECONDS = float(os.getenv('MAX_CLIP_SECONDS', 60))
+
+#Incidentes (ver incidentes.py): alertas de una cámara separadas por menos de
+#INCIDENT_WINDOW_SECONDS (o INCIDENT_TRACK_WINDOW_SECONDS si comparten personas)
+#son el mismo incidente; mientras sigue abierto se publica a lo sumo un
+#INCIDENT_UPDATE cada INCIDENT_UPDATE_SECONDS.
+INCIDENT_WINDOW_SECONDS = float(os.getenv('INCIDENT_WINDOW_SECONDS', 10))
+INCIDENT_TRACK_WINDOW_SECONDS = float(os.getenv('INCIDENT_TRACK_WINDOW_SECONDS', 30))
+INCIDENT_UPDATE_SECONDS = float(os.getenv('INCIDENT_UPDATE_SECONDS', 10))
+
+#Vista previa opcional (vista.py): MJPEG por HTTP en vez de cv2.imshow. Solo
+#codifica mientras alguien mira una cámara, a PREVIEW_FPS y PREVIEW_WIDTH px de ancho.
+PREVIEW_ENABLED = os.getenv('PREVIEW_ENABLED', '0') == '1'
+PREVIEW_HOST = os.getenv('PREVIEW_HOST', '127.0.0.1')
+PREVIEW_PORT = int(os.getenv('PREVIEW_PORT', 8090))
+PREVIEW_FPS = float(os.getenv('PREVIEW_FPS', 5))
+PREVIEW_WIDTH = int(os.getenv('PREVIEW_WIDTH', 320))
+PREVIEW_QUALITY = int(os.getenv('PREVIEW_QUALITY', 70))
+
+#Búfer para guardar los segundos previos al evento
+PRE_EVENT_BUFFER_SECONDS = 3
+PRE_EVENT_BUFFER_SIZE = int(VIDEO_FPS * PRE_EVENT_BUFFER_SECONDS)
+
+#Arreglos de trabajo reutilizables por cámara (ver buffers.py). Solo se usan si
+#el frame llega con otra resolución y hay que redimensionarlo.
+FRAME_SLOTS = int(os.getenv('FRAME_SLOTS', 4))
+
+#Cada cámara (app_id) tiene su propia sesión con tracker, búfer y grabación.
+#Las sesiones sin frames durante SESSION_IDLE_SECONDS se descartan.
+SESSION_IDLE_SECONDS = float(os.getenv('SESSION_IDLE_SECONDS', 60))
+TRACK_STALE_SECONDS = 5
+
+#Tabla de tracks por cámara (seguimiento.py): personas como máximo, posiciones
+#guardadas por persona y constante de tiempo (s) de la velocidad suavizada. La
+#regla de velocidad compara esa velocidad con SPEED_THRESHOLD * VIDEO_FPS px/s.
+TRACK_CAPACITY = int(os.getenv('TRACK_CAPACITY', 256))
+TRACK_HISTORY = int(os.getenv('TRACK_HISTORY', 8))
+TRACK_VELOCITY_TAU = float(os.getenv('TRACK_VELOCITY_TAU', 0.2))
+
+#Etapas del pipeline: hilos de decodificación, un hilo de inferencia y
+#trabajadores de anotación/grabación (cada cámara va siempre al mismo).
+#PIPELINE_CAPACITY es también el prefetch del consumidor: RabbitMQ nunca
+#entrega más frames de los que caben entre todas las etapas.
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', 2))
+ANNOTATE_WORKERS = int(os.getenv('ANNOTATE_WORKERS', 2))
+PIPELINE_CAPACITY = int(os.getenv('PIPELINE_CAPACITY', 32))
+
+#Modo en vivo: la cola de frames tiene largo y TTL máximos (RabbitMQ descarta
+#los más antiguos) y el nodo, ante varios frames pendientes de una cámara, solo
+#analiza el más nuevo. MAX_FRAME_AGE_MS descarta además frames más viejos que
+#ese límite según la hora de captura (0 lo desactiva).
+LIVE_MODE = os.getenv('LIVE_MODE', '1') == '1'
+FRAME_QUEUE_MAX_LENGTH = int(os.getenv('FRAME_QUEUE_MAX_LENGTH', 200))
+FRAME_QUEUE_TTL_MS = int(os.getenv('FRAME_QUEUE_TTL_MS', 5000))
+MAX_FRAME_AGE_MS = float(os.getenv('MAX_FRAME_AGE_MS', 0))
+METRICS_REPORT_SECONDS = float(os.getenv('METRICS_REPORT_SECONDS', 30))
+
+#Endpoint /metrics (formato Prometheus) de este nodo
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9100))
+
+#Filtro de movimiento: si entre el frame actual y el último inferido cambia
+#menos de MOTION_MIN_CHANGED_FRACTION de los píxeles (diferencia mayor que
+#MOTION_PIXEL_THRESHOLD en una miniatura gris), no se pasa por YOLO y se
+#reutilizan los tracks anteriores. Igual se infiere al menos un frame de cada
+#KEYFRAME_INTERVAL.
+MOTION_GATE = os.getenv('MOTION_GATE', '1') == '1'
+MOTION_PIXEL_THRESHOLD = int(os.getenv('MOTION_PIXEL_THRESHOLD', 25))
+MOTION_MIN_CHANGED_FRACTION = float(os.getenv('MOTION_MIN_CHANGED_FRACTION', 0.002))
+KEYFRAME_INTERVAL = int(os.getenv('KEYFRAME_INTERVAL', 10))
+
+## ----------------------------------------------------------------
+## CONEXIÓN CON RABBITMQ
+## ----------------------------------------------------------------
+RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
+RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', 5671))
+#En modo en vivo la cola es otra (camera_frames.live): RabbitMQ rechaza con
+#PRECONDITION_FAILED redeclarar la camera_frames de siempre con límites.
+#Los argumentos deben coincidir con los que declara el emisor por lo mismo.
+QUEUE_NAME = 'camera_frames.live' if LIVE_MODE else 'camera_frames'
+FRAME_QUEUE_ARGUMENTS = {
+    'x-max-length': FRAME_QUEUE_MAX_LENGTH,
+    'x-message-ttl': FRAME_QUEUE_TTL_MS,
+    'x-overflow': 'drop-head',
+} if LIVE_MODE else None
+ALERTS_QUEUE = 'alerts_log'
+
+#Enrutamiento de frames: 'queue' usa la cola única camera_frames (un solo nodo
+#o reparto round-robin); 'shard' reparte las cámaras entre los nodos vivos para
+#que cada cámara la atienda siempre el mismo nodo. SHARD_COUNT debe coincidir
+#con el del emisor.
+FRAME_ROUTING = os.getenv('FRAME_ROUTING', 'queue')
+NODE_ID = os.getenv('NODE_ID', socket.gethostname())
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', 64))
+NODE_HEARTBEAT_SECONDS = float(os.getenv('NODE_HEARTBEAT_SECONDS', 2))
+
+#Cada CONTROL_INTERVAL_SECONDS el nodo publica su carga en el exchange
+#camera_control; los emisores bajan o suben fps y calidad según ella.
+CONTROL_EXCHANGE = 'camera_control'
+CONTROL_INTERVAL_SECONDS = float(os.getenv('CONTROL_INTERVAL_SECONDS', 2))
+CA_CERT_PATH = os.getenv('CA_CERT')
+CLIENT_CERT_PATH = os.getenv('CLIENT_CERT')
+CLIENT_KEY_PATH = os.getenv('CLIENT_KEY')
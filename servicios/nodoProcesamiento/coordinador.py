@@ -0,0 +1,173 @@
+# --- IMPORTS ---
+import hashlib
+import json
+import time
+import zlib
+
+## ----------------------------------------------------------------
+## REPARTO DE CÁMARAS ENTRE NODOS DE PROCESAMIENTO
+## ----------------------------------------------------------------
+#Cada cámara cae siempre en el mismo shard (crc32 de su CAMERA_ID, igual que en
+#el emisor). Cada shard tiene un único dueño, elegido por rendezvous hashing
+#entre los nodos vivos: todos los nodos calculan el mismo reparto a partir de
+#la misma lista de miembros y, cuando un nodo entra o sale, solo se mueven los
+#shards que ganaba o perdía ese nodo.
+#
+#Traspaso sin huecos: cada heartbeat lleva los shards que el nodo tiene
+#enlazados. Quien gana un shard lo enlaza enseguida y lo anuncia; quien lo
+#pierde lo desenlaza recién cuando ve ese anuncio del nuevo dueño (o pasado
+#HANDOVER_HEARTBEATS heartbeats). Mientras tanto los dos nodos reciben los
+#frames de esas cámaras: es mejor procesar alguno dos veces que perderlos.
+FRAMES_EXCHANGE = 'camera_frames.shards'
+MEMBERSHIP_EXCHANGE = 'processing_nodes'
+#Más que la espera inicial de un nodo nuevo (2 heartbeats) y que el plazo para
+#darlo por muerto (3): si el nuevo dueño muere, el shard vuelve antes de soltarlo
+HANDOVER_HEARTBEATS = 4
+
+
+def shard_for(camera_id, shard_count):
+    return zlib.crc32(camera_id.encode('utf-8')) % shard_count
+
+
+def shard_routing_key(shard):
+    return f"shard.{shard}"
+
+
+def owner_for(shard, nodes):
+    def score(node_id):
+        digest = hashlib.blake2b(f"{node_id}:{shard}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    return max(nodes, key=score)
+
+
+class ShardCoordinator:
+    #Coordinador local: anuncia este nodo, escucha a los demás y enlaza la cola
+    #propia solo a los shards que le tocan. Corre en el hilo de la conexión
+    #(tick() desde el bucle principal).
+
+    def __init__(self, channel, node_id, queue_name, shard_count, heartbeat_seconds, queue_arguments=None):
+        self.channel = channel
+        self.node_id = node_id
+        self.queue_name = queue_name
+        self.shard_count = shard_count
+        self.heartbeat_seconds = heartbeat_seconds
+        self.queue_arguments = queue_arguments
+        #node_id -> último heartbeat visto (monotonic)
+        self.members = {node_id: time.monotonic()}
+        #node_id -> shards que ese nodo anunció tener enlazados
+        self.peer_bound = {}
+        self.owned = set()
+        #Shards que ya no nos tocan pero siguen enlazados: shard -> plazo (monotonic)
+        self.releasing = {}
+        self.next_heartbeat = 0.0
+        #Esperar un par de heartbeats antes del primer reparto para conocer a los demás
+        self.settle_until = time.monotonic() + 2 * heartbeat_seconds
+        self.dirty = True
+
+    def start(self):
+        ch = self.channel
+        ch.exchange_declare(exchange=FRAMES_EXCHANGE, exchange_type='direct', durable=True)
+        ch.exchange_declare(exchange=MEMBERSHIP_EXCHANGE, exchange_type='fanout')
+
+        #Cola exclusiva: si el nodo muere, la cola y sus bindings desaparecen con él
+        ch.queue_declare(queue=self.queue_name, exclusive=True, arguments=self.queue_arguments)
+
+        membership = ch.queue_declare(queue='', exclusive=True).method.queue
+        ch.queue_bind(queue=membership, exchange=MEMBERSHIP_EXCHANGE)
+        ch.basic_consume(queue=membership, on_message_callback=self._on_member, auto_ack=True)
+        self._announce('join')
+
+    def stop(self):
+        try:
+            self._announce('leave')
+        except Exception as e:
+            print(f"--- [COORDINADOR] No se pudo anunciar la salida: {e} ---")
+
+    def tick(self):
+        now = time.monotonic()
+        if now >= self.next_heartbeat:
+            self._announce('heartbeat')
+
+        dead = [n for n, seen in self.members.items()
+                if n != self.node_id and now - seen > 3 * self.heartbeat_seconds]
+        for node_id in dead:
+            del self.members[node_id]
+            self.peer_bound.pop(node_id, None)
+            print(f"--- [COORDINADOR] Nodo '{node_id}' sin heartbeat, se reparte su carga. ---")
+            self.dirty = True
+
+        if self.dirty and now >= self.settle_until:
+            self._rebalance()
+        if self.releasing:
+            self._release(now)
+
+    def _announce(self, event):
+        #bound: todo lo enlazado, incluidos los shards que se están soltando
+        bound = sorted(self.owned | set(self.releasing))
+        body = json.dumps({'node_id': self.node_id, 'event': event, 'bound': bound})
+        self.channel.basic_publish(exchange=MEMBERSHIP_EXCHANGE, routing_key='', body=body)
+        self.next_heartbeat = time.monotonic() + self.heartbeat_seconds
+
+    def _on_member(self, ch, method, properties, body):
+        #Un mensaje mal formado en el exchange no debe tirar el hilo de la conexión
+        try:
+            message = json.loads(body)
+            node_id, event = str(message['node_id']), message['event']
+            bound = set(message.get('bound', ()))
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"--- [COORDINADOR] Mensaje de membresía inválido: {e} ---")
+            return
+        if node_id == self.node_id:
+            return
+
+        if event == 'leave':
+            self.peer_bound.pop(node_id, None)
+            if self.members.pop(node_id, None) is not None:
+                print(f"--- [COORDINADOR] Nodo '{node_id}' salió. ---")
+                self.dirty = True
+            return
+
+        if node_id not in self.members:
+            print(f"--- [COORDINADOR] Nodo '{node_id}' se unió. ---")
+            self.dirty = True
+            #Responder enseguida para que el nodo nuevo nos vea antes de repartir
+            if event == 'join':
+                self._announce('heartbeat')
+        self.members[node_id] = time.monotonic()
+        self.peer_bound[node_id] = bound
+
+    def _rebalance(self):
+        nodes = sorted(self.members)
+        owned = {s for s in range(self.shard_count) if owner_for(s, nodes) == self.node_id}
+
+        #Primero enlazar lo nuevo (lo que se estaba soltando ya está enlazado)
+        gained = owned - self.owned
+        for shard in sorted(gained):
+            if self.releasing.pop(shard, None) is None:
+                self.channel.queue_bind(queue=self.queue_name, exchange=FRAMES_EXCHANGE,
+                                        routing_key=shard_routing_key(shard))
+        deadline = time.monotonic() + HANDOVER_HEARTBEATS * self.heartbeat_seconds
+        for shard in self.owned - owned:
+            self.releasing[shard] = deadline
+
+        self.owned = owned
+        self.dirty = False
+        #Avisar enseguida a los dueños anteriores de que ya estamos enlazados
+        if gained:
+            self._announce('heartbeat')
+        print(f"--- [COORDINADOR] {len(nodes)} nodo(s) activos; este nodo atiende "
+              f"{len(owned)}/{self.shard_count} shards. ---")
+
+    def _release(self, now):
+        #Desenlaza los shards cuyo nuevo dueño ya anunció tenerlos, o vencidos
+        nodes = sorted(self.members)
+        for shard, deadline in list(self.releasing.items()):
+            owner = owner_for(shard, nodes)
+            if owner == self.node_id:
+                continue
+            if shard in self.peer_bound.get(owner, ()) or now >= deadline:
+                self.channel.queue_unbind(queue=self.queue_name, exchange=FRAMES_EXCHANGE,
+                                          routing_key=shard_routing_key(shard))
+                del self.releasing[shard]
+                if now >= deadline:
+                    print(f"--- [COORDINADOR] Shard {shard} soltado sin confirmación de '{owner}'. ---")
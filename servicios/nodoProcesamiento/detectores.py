@@ -0,0 +1,218 @@
+# --- IMPORTS ---
+import abc
+import ast
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+from ultralytics.engine.results import Boxes
+
+## ----------------------------------------------------------------
+## BACKENDS DEL DETECTOR
+## ----------------------------------------------------------------
+#Todos los detectores tienen la misma interfaz:
+#  names            {id de clase: nombre}
+#  classes          IDs de clase que se devuelven (None = todas)
+#  detect(frames)   una lista de Boxes de ultralytics (x1, y1, x2, y2, conf, cls)
+#                   por frame, en coordenadas del frame; es lo que espera BYTETracker
+#  warmup(...)      inferencias de prueba antes de consumir frames
+#
+#'ultralytics' corre el .pt en PyTorch. 'onnx' y 'openvino' exportan el modelo
+#una vez a MODEL_CACHE_DIR y después lo cargan desde ahí en cada arranque;
+#corren sin PyTorch en la inferencia, con su propio pre y posprocesado.
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+LETTERBOX_COLOR = 114
+
+
+class UltralyticsDetector:
+    def __init__(self, weights, imgsz, threads, conf, iou):
+        import torch
+        from ultralytics import YOLO
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = YOLO(weights)
+        self.names = self.model.names
+        self.classes = None
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+    def detect(self, frames):
+        #Una sola llamada al modelo por lote de frames, de cualquier cámara
+        results = self.model.predict(frames, classes=self.classes, imgsz=self.imgsz, conf=self.conf, iou=self.iou,
+                                     verbose=False)
+        return [result.boxes.cpu().numpy() for result in results]
+
+    def warmup(self, width, height, batch_sizes):
+        return _warmup(self, width, height, batch_sizes)
+
+
+class ExportedDetector(abc.ABC):
+    #Pre y posprocesado de YOLOv8 para los modelos exportados: letterbox a
+    #imgsz x imgsz, salida (lote, 4 + clases, anclas) y NMS con OpenCV
+
+    def __init__(self, imgsz, conf, iou, names):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.names = names
+        self.classes = None
+
+    def detect(self, frames):
+        blob, transforms = self._preprocess(frames)
+        output = self._run(blob)
+        return [self._postprocess(prediction, transform, frame.shape[:2])
+                for prediction, transform, frame in zip(output, transforms, frames)]
+
+    def warmup(self, width, height, batch_sizes):
+        return _warmup(self, width, height, batch_sizes)
+
+    @abc.abstractmethod
+    def _run(self, blob):
+        #Corre el modelo sobre el lote preprocesado y devuelve su salida cruda
+        pass
+
+    def _preprocess(self, frames):
+        size = self.imgsz
+        images, transforms = [], []
+        for frame in frames:
+            height, width = frame.shape[:2]
+            ratio = min(size / height, size / width)
+            new_w, new_h = round(width * ratio), round(height * ratio)
+            pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+            image = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+            if (new_w, new_h) != (width, height):
+                frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+            image[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = frame
+            images.append(image)
+            transforms.append((ratio, pad_x, pad_y))
+        #BGR -> RGB, HWC -> CHW y /255 en una sola llamada de OpenCV
+        blob = cv2.dnn.blobFromImages(images, scalefactor=1 / 255.0, swapRB=True)
+        return blob, transforms
+
+    def _postprocess(self, prediction, transform, shape):
+        #prediction: (4 + clases, anclas) con cajas (cx, cy, w, h) en píxeles de imgsz
+        prediction = prediction.T
+        scores = prediction[:, 4:]
+        cls = scores.argmax(axis=1)
+        conf = scores[np.arange(len(scores)), cls]
+        keep = conf > self.conf
+        if self.classes is not None:
+            keep &= np.isin(cls, self.classes)
+        boxes, conf, cls = prediction[keep, :4], conf[keep], cls[keep]
+
+        data = np.zeros((0, 6), dtype=np.float32)
+        if len(boxes):
+            xywh = boxes.copy()
+            xywh[:, :2] -= xywh[:, 2:] / 2
+            #Desplazar las cajas por clase para que el NMS no mezcle clases
+            offset = (cls * (self.imgsz + 1))[:, None].astype(np.float32)
+            shifted = xywh.copy()
+            shifted[:, :2] += offset
+            kept = cv2.dnn.NMSBoxes(shifted.tolist(), conf.tolist(), self.conf, self.iou)
+            kept = np.asarray(kept, dtype=int).reshape(-1)
+            if len(kept):
+                ratio, pad_x, pad_y = transform
+                xyxy = np.empty((len(kept), 4), dtype=np.float32)
+                xyxy[:, 0] = (xywh[kept, 0] - pad_x) / ratio
+                xyxy[:, 1] = (xywh[kept, 1] - pad_y) / ratio
+                xyxy[:, 2] = xyxy[:, 0] + xywh[kept, 2] / ratio
+                xyxy[:, 3] = xyxy[:, 1] + xywh[kept, 3] / ratio
+                xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+                xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+                data = np.column_stack([xyxy, conf[kept], cls[kept]]).astype(np.float32)
+        return Boxes(data, shape)
+
+
+class OnnxDetector(ExportedDetector):
+    def __init__(self, path, imgsz, threads, conf, iou):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        #ultralytics guarda los nombres de las clases en los metadatos del .onnx
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        super().__init__(imgsz, conf, iou, ast.literal_eval(metadata['names']))
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoDetector(ExportedDetector):
+    def __init__(self, path, imgsz, threads, conf, iou):
+        import openvino as ov
+        from ultralytics.utils import yaml_load
+        core = ov.Core()
+        model = core.read_model(os.path.join(path, _openvino_xml(path)))
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads > 0:
+            config['INFERENCE_NUM_THREADS'] = threads
+        self.compiled = core.compile_model(model, 'CPU', config)
+        self.request = self.compiled.create_infer_request()
+        metadata = yaml_load(os.path.join(path, 'metadata.yaml'))
+        super().__init__(imgsz, conf, iou, metadata['names'])
+
+    def _run(self, blob):
+        return self.request.infer({0: blob})[self.compiled.output(0)]
+
+
+def _openvino_xml(path):
+    return next(name for name in os.listdir(path) if name.endswith('.xml'))
+
+
+def _warmup(detector, width, height, batch_sizes):
+    #La primera inferencia de cada tamaño de lote reserva memoria y elige
+    #kernels; mejor pagarla antes de consumir frames
+    started = time.perf_counter()
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    for batch in batch_sizes:
+        detector.detect([frame] * batch)
+    return time.perf_counter() - started
+
+
+## ----------------------------------------------------------------
+## EXPORTACIÓN CON CACHÉ EN DISCO
+## ----------------------------------------------------------------
+def cached_export(weights, backend, imgsz, cache_dir):
+    #Devuelve la ruta del modelo exportado para backend e imgsz. Se reutiliza
+    #mientras sea más nuevo que los pesos; si no, se exporta con ultralytics
+    #(necesita PyTorch solo esta vez) y se mueve a cache_dir.
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    if backend == 'onnx':
+        target = os.path.join(cache_dir, f"{stem}-{imgsz}.onnx")
+    else:
+        target = os.path.join(cache_dir, f"{stem}-{imgsz}_openvino_model")
+    if os.path.exists(target) and (not os.path.exists(weights)
+                                   or os.path.getmtime(target) >= os.path.getmtime(weights)):
+        return target
+
+    from ultralytics import YOLO
+    print(f"--- [PROCESAMIENTO] Exportando {weights} a {backend} ({imgsz}px)... ---")
+    exported = YOLO(weights).export(format=backend, imgsz=imgsz, dynamic=True, verbose=False)
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    shutil.move(str(exported), target)
+    return target
+
+
+def load_detector(backend, weights, imgsz, threads, conf, iou, cache_dir, classes=('person',)):
+    #classes: nombres de las clases a detectar (None = todas)
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido '{backend}' (opciones: {', '.join(BACKENDS)})")
+    if backend == 'ultralytics':
+        detector = UltralyticsDetector(weights, imgsz, threads, conf, iou)
+    elif backend == 'onnx':
+        detector = OnnxDetector(cached_export(weights, backend, imgsz, cache_dir), imgsz, threads, conf, iou)
+    else:
+        detector = OpenVinoDetector(cached_export(weights, backend, imgsz, cache_dir), imgsz, threads, conf, iou)
+    if classes is not None:
+        wanted = {name.lower() for name in classes}
+        detector.classes = [cls for cls, name in detector.names.items() if name.lower() in wanted]
+    return detector
@@ -0,0 +1,147 @@
+# --- IMPORTS ---
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+from metricas import CLIP_FRAMES_DROPPED
+
+## ----------------------------------------------------------------
+## GRABADOR DE CLIPS EN SEGUNDO PLANO
+## ----------------------------------------------------------------
+#El hilo que detecta solo copia el frame anotado a la cola del clip; cada clip
+#tiene su propio hilo que decodifica el pre-evento, codifica con VideoWriter y
+#cierra el archivo. Si la cola del clip está llena el frame se descarta: la
+#grabación nunca frena la detección.
+_CLOSE = object()
+
+
+class Clip:
+    def __init__(self, recorder, camera_id, filename, pre_event, track_ids, end_time, max_end_time):
+        self.recorder = recorder
+        self.camera_id = camera_id
+        self.filename = filename
+        self.start_time = time.time()
+        self.end_time = end_time
+        self.max_end_time = max_end_time
+        self.track_ids = set(int(t) for t in track_ids)
+        self.pre_event = pre_event
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self.closed_at = None
+        self.queue = queue.Queue(maxsize=recorder.queue_size)
+        self.thread = threading.Thread(target=self._run, name=f'clip-{camera_id}', daemon=True)
+        self.thread.start()
+
+    def extend(self, end_time, track_ids):
+        #Una alerta nueva durante la grabación alarga el clip (hasta el máximo)
+        self.end_time = min(max(self.end_time, end_time), self.max_end_time)
+        self.track_ids.update(int(t) for t in track_ids)
+
+    def is_due(self, now):
+        return now >= self.end_time
+
+    def add(self, frame):
+        try:
+            self.queue.put_nowait(frame.copy())
+        except queue.Full:
+            self.frames_dropped += 1
+            CLIP_FRAMES_DROPPED.inc(self.camera_id)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.closed_at = time.time()
+            self.queue.put(_CLOSE)
+
+    def _run(self):
+        writer = None
+        pre_event_frames = 0
+        try:
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            writer = cv2.VideoWriter(self.filename, fourcc, self.recorder.fps, self.recorder.size)
+
+            #Escribir los frames del búfer (el pre-evento), que llegan como JPEG
+            for jpeg in self.pre_event:
+                f = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if f is None:
+                    continue
+                if (f.shape[1], f.shape[0]) != self.recorder.size:
+                    f = cv2.resize(f, self.recorder.size)
+                writer.write(f)
+                pre_event_frames += 1
+            self.pre_event = None
+
+            while True:
+                frame = self.queue.get()
+                if frame is _CLOSE:
+                    break
+                writer.write(frame)
+                self.frames_written += 1
+        except Exception:
+            print(f"--- [GRABADOR] Error grabando {self.filename}: ---")
+            traceback.print_exc()
+        finally:
+            if writer is not None:
+                writer.release()
+
+        self.recorder._index(self, pre_event_frames)
+        print(f"--- [GRABACIÓN FINALIZADA] Video guardado en {self.filename}. ---")
+
+
+class ClipRecorder:
+    def __init__(self, output_dir, fps, size, queue_size, max_clip_seconds):
+        self.output_dir = output_dir
+        self.fps = fps
+        self.size = size
+        self.queue_size = queue_size
+        self.max_clip_seconds = max_clip_seconds
+        self.index_path = os.path.join(output_dir, 'index.jsonl')
+        self.lock = threading.Lock()
+        self.clips = set()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start(self, camera_id, pre_event, track_ids, duration):
+        now = time.time()
+        timestamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        filename = os.path.join(self.output_dir, f"agresion-{timestamp}-{camera_id}.avi")
+        clip = Clip(self, camera_id, filename, list(pre_event), track_ids,
+                    now + duration, now + self.max_clip_seconds)
+        with self.lock:
+            self.clips.add(clip)
+        return clip
+
+    def shutdown(self):
+        #Cierra los clips abiertos y espera a que terminen de escribirse
+        with self.lock:
+            clips = list(self.clips)
+        for clip in clips:
+            clip.close()
+            clip.thread.join()
+
+    def _index(self, clip, pre_event_frames):
+        #Archivo JSON al lado del video y una línea en output/index.jsonl, para
+        #encontrar clips sin recorrer la carpeta
+        entry = {
+            'camera_id': clip.camera_id,
+            'file': os.path.basename(clip.filename),
+            'start': clip.start_time,
+            'end': clip.closed_at,
+            'track_ids': sorted(clip.track_ids),
+            'pre_event_frames': pre_event_frames,
+            'frames': clip.frames_written,
+            'dropped_frames': clip.frames_dropped,
+        }
+        line = json.dumps(entry, ensure_ascii=False)
+        with open(os.path.splitext(clip.filename)[0] + '.json', 'w') as sidecar:
+            sidecar.write(line + '\n')
+        with self.lock:
+            with open(self.index_path, 'a') as index:
+                index.write(line + '\n')
+            self.clips.discard(clip)
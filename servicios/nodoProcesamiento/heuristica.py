@@ -0,0 +1,74 @@
+# --- IMPORTS ---
+import numpy as np
+
+## ----------------------------------------------------------------
+## HEURÍSTICA DE AGRESIÓN (V1) VECTORIZADA
+## ----------------------------------------------------------------
+#Trabaja sobre arreglos de centros (n, 2) en lugar de recorrer pares en Python.
+#Hasta DENSE_MAX personas se calcula la matriz completa de distancias; con más
+#gente se usa un barrido ordenado por x que solo compara vecinos cercanos.
+DENSE_MAX = 64
+
+
+def proximity_alerts(centers, threshold):
+    #Máscara de personas que tienen a alguien a menos de threshold
+    centers = np.asarray(centers, dtype=np.float64)
+    n = len(centers)
+    if n < 2:
+        return np.zeros(n, dtype=bool)
+    if n <= DENSE_MAX:
+        return _proximity_dense(centers, threshold * threshold)
+    return _proximity_sweep(centers, threshold)
+
+
+def _proximity_dense(centers, threshold_sq):
+    diff = centers[:, None, :] - centers[None, :, :]
+    close = np.einsum('ijk,ijk->ij', diff, diff) < threshold_sq
+    np.fill_diagonal(close, False)
+    return close.any(axis=1)
+
+
+def _proximity_sweep(centers, threshold):
+    n = len(centers)
+    order = np.argsort(centers[:, 0], kind='stable')
+    xs = centers[order, 0]
+    ys = centers[order, 1]
+
+    #Para cada i, los candidatos están entre i+1 y el primer j con xs[j] >= xs[i] + threshold
+    ends = np.searchsorted(xs, xs + threshold, side='left')
+    width = int((ends - np.arange(n)).max())
+    threshold_sq = threshold * threshold
+
+    flags = np.zeros(n, dtype=bool)
+    for k in range(1, width):
+        i = np.arange(n - k)
+        j = i + k
+        dx = xs[j] - xs[i]
+        dy = ys[j] - ys[i]
+        close = (j < ends[:n - k]) & (dx * dx + dy * dy < threshold_sq)
+        flags[i[close]] = True
+        flags[j[close]] = True
+
+    result = np.empty(n, dtype=bool)
+    result[order] = flags
+    return result
+
+
+def velocity_alerts(speeds, has_velocity, threshold):
+    #Máscara de personas cuya velocidad suavizada (px/s, seguimiento.TrackTable) supera threshold
+    return (np.asarray(speeds) > threshold) & np.asarray(has_velocity, dtype=bool)
+
+
+def alert_reasons(ids, centers, speed, proximity_threshold):
+    #Dice qué regla disparó cada ID: {id: ['speed', 'proximity']}. speed es la
+    #máscara de la regla de velocidad (velocity_alerts)
+    ids = np.asarray(ids)
+    if len(ids) == 0:
+        return {}
+    speed = np.asarray(speed, dtype=bool)
+    proximity = proximity_alerts(centers, proximity_threshold)
+    fired = speed | proximity
+    reasons = {}
+    for track_id, fast, close in zip(ids[fired].tolist(), speed[fired], proximity[fired]):
+        reasons[track_id] = [name for name, hit in (('speed', fast), ('proximity', close)) if hit]
+    return reasons
@@ -0,0 +1,124 @@
+# --- IMPORTS ---
+import threading
+import time
+import uuid
+
+from metricas import INCIDENT_EVENTS
+
+## ----------------------------------------------------------------
+## AGRUPACIÓN DE ALERTAS EN INCIDENTES
+## ----------------------------------------------------------------
+#Una pelea dispara alertas en muchos frames seguidos. En vez de publicar cada
+#una, las alertas de una cámara se juntan en un incidente mientras sigan
+#llegando dentro de window_seconds desde la última (o dentro de
+#track_window_seconds si comparten algún track ID con el incidente). Al
+#servidor de logs solo le llegan tres tipos de evento:
+#  INCIDENT_OPEN   primera alerta del incidente
+#  INCIDENT_UPDATE se sumaron personas o un clip nuevo, o cada update_seconds
+#  INCIDENT_CLOSE  pasó la ventana sin alertas (expire) o se apaga el nodo
+
+
+class Incident:
+    def __init__(self, camera_id, now):
+        self.incident_id = uuid.uuid4().hex
+        self.camera_id = camera_id
+        self.started_at = now
+        self.last_alert_at = now
+        self.last_update_at = now
+        self.alert_count = 0
+        self.track_ids = set()
+        self.heuristics = set()
+        self.clips = []
+
+    def event(self, alert_type, now, boxes=None, reasons=None):
+        message = {
+            "timestamp": now,
+            "alert_type": alert_type,
+            "incident_id": self.incident_id,
+            "camera_id": self.camera_id,
+            "started_at": self.started_at,
+            "last_alert_at": self.last_alert_at,
+            "alert_count": self.alert_count,
+            "track_ids": sorted(self.track_ids),
+            "heuristics": sorted(self.heuristics),
+            "clips": list(self.clips),
+        }
+        #Solo la apertura y las actualizaciones llevan el detalle del frame
+        if boxes is not None:
+            message["boxes"] = boxes
+            message["reasons"] = reasons
+        return message
+
+
+class IncidentAggregator:
+    def __init__(self, publish, window_seconds, track_window_seconds, update_seconds):
+        #publish(camera_id, mensaje), el mismo que usaba la alerta suelta
+        self.publish = publish
+        self.window_seconds = window_seconds
+        self.track_window_seconds = track_window_seconds
+        self.update_seconds = update_seconds
+        self.open = {}
+        self.lock = threading.Lock()
+
+    def observe(self, camera_id, alert_ids, detections, reasons, clip_filename=None, now=None):
+        #Registra las alertas de un frame. detections es {track_id: {'pos', 'box'}}
+        now = time.time() if now is None else now
+        alert_ids = set(int(t) for t in alert_ids)
+        boxes = {str(t): [int(v) for v in detections[t]['box']] for t in alert_ids if t in detections}
+        frame_reasons = {str(t): list(reasons.get(t, ())) for t in alert_ids}
+        events = []
+
+        with self.lock:
+            incident = self.open.get(camera_id)
+            if incident is not None and not self._joins(incident, alert_ids, now):
+                events.append(incident.event("INCIDENT_CLOSE", now))
+                incident = None
+            if incident is None:
+                incident = self.open[camera_id] = Incident(camera_id, now)
+
+            new_tracks = bool(alert_ids - incident.track_ids)
+            incident.track_ids |= alert_ids
+            for names in frame_reasons.values():
+                incident.heuristics.update(names)
+            new_clip = clip_filename is not None and clip_filename not in incident.clips
+            if new_clip:
+                incident.clips.append(clip_filename)
+            incident.alert_count += 1
+            incident.last_alert_at = now
+
+            if incident.alert_count == 1:
+                events.append(incident.event("INCIDENT_OPEN", now, boxes, frame_reasons))
+            elif new_tracks or new_clip or now - incident.last_update_at >= self.update_seconds:
+                events.append(incident.event("INCIDENT_UPDATE", now, boxes, frame_reasons))
+                incident.last_update_at = now
+
+        for message in events:
+            self._emit(message)
+
+    def expire(self, now=None):
+        #Cierra los incidentes que llevan más de la ventana sin alertas
+        now = time.time() if now is None else now
+        with self.lock:
+            expired = [cid for cid, inc in self.open.items()
+                       if now - inc.last_alert_at > max(self.window_seconds, self.track_window_seconds)]
+            closed = [self.open.pop(cid) for cid in expired]
+        for incident in closed:
+            self._emit(incident.event("INCIDENT_CLOSE", now))
+
+    def close_all(self):
+        now = time.time()
+        with self.lock:
+            closed = list(self.open.values())
+            self.open.clear()
+        for incident in closed:
+            self._emit(incident.event("INCIDENT_CLOSE", now))
+
+    def _emit(self, message):
+        INCIDENT_EVENTS.inc(message["camera_id"], message["alert_type"])
+        self.publish(message["camera_id"], message)
+
+    def _joins(self, incident, alert_ids, now):
+        idle = now - incident.last_alert_at
+        if idle <= self.window_seconds:
+            return True
+        return idle <= self.track_window_seconds and bool(alert_ids & incident.track_ids)
@@ -0,0 +1,82 @@
+# --- IMPORTS ---
+import inspect
+import queue
+import threading
+import time
+
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+
+## ----------------------------------------------------------------
+## TRACKERS POR CÁMARA
+## ----------------------------------------------------------------
+#model.track(persist=True) mantiene un único tracker; al hacer inferencia en lote
+#cada cámara necesita el suyo, así que lo creamos a mano con la misma configuración.
+TRACKER_CONFIG = IterableSimpleNamespace(**yaml_load(check_yaml('bytetrack.yaml')))
+#Las versiones nuevas de BYTETracker ya no reciben frame_rate (usan track_buffer tal cual)
+_TAKES_FRAME_RATE = 'frame_rate' in inspect.signature(BYTETracker.__init__).parameters
+#Protege BaseTrack._count mientras un tracker lo usa (ver SessionTracker)
+_COUNTER_LOCK = threading.Lock()
+
+
+class SessionTracker(BYTETracker):
+    #En ultralytics < 8.4 los IDs salen de un contador de clase (BaseTrack._count)
+    #que comparte todo el proceso, y cada BYTETracker nuevo lo pone en 0: abrir
+    #la sesión de una cámara reiniciaba los IDs de las demás y dos personas
+    #vivas podían quedar con el mismo ID. Cada sesión lleva su propio contador y
+    #lo carga en el de clase solo durante su update(), bajo un lock porque los
+    #trabajadores de anotación corren en paralelo. Las versiones que ya numeran
+    #por tracker (self._ids) se usan tal cual.
+
+    def __init__(self, args, frame_rate):
+        with _COUNTER_LOCK:
+            if _TAKES_FRAME_RATE:
+                super().__init__(args, frame_rate=frame_rate)
+            else:
+                super().__init__(args)
+        self.own_ids = hasattr(self, '_ids')
+        self.id_count = 0
+
+    def update(self, results, img=None, **kwargs):
+        if self.own_ids:
+            return super().update(results, img, **kwargs)
+        with _COUNTER_LOCK:
+            BaseTrack._count = self.id_count
+            try:
+                return super().update(results, img, **kwargs)
+            finally:
+                self.id_count = BaseTrack._count
+
+
+def make_tracker(frame_rate):
+    return SessionTracker(TRACKER_CONFIG, int(frame_rate))
+
+
+## ----------------------------------------------------------------
+## INFERENCIA EN LOTE
+## ----------------------------------------------------------------
+#Los detectores (una llamada al modelo por lote) están en detectores.py
+def collect_batch(source, max_size, max_wait_ms, stop=None):
+    #Bloquea hasta el primer elemento y luego junta más durante max_wait_ms,
+    #hasta max_size. Si llega el marcador stop, se devuelve lo reunido y True.
+    first = source.get()
+    if first is stop:
+        return [], True
+
+    batch = [first]
+    deadline = time.monotonic() + max_wait_ms / 1000.0
+    while len(batch) < max_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = source.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is stop:
+            return batch, True
+        batch.append(item)
+    return batch, False
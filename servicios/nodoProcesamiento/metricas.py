@@ -0,0 +1,45 @@
+# --- IMPORTS ---
+#El núcleo (Counter, Gauge, Histogram y el endpoint /metrics) es común a los
+#tres servicios y vive en servicios/comun/metricas.py. La imagen copia comun/ en
+#/opt/servicios y lo pone en PYTHONPATH (ver el Dockerfile); desde el
+#repositorio se corre con PYTHONPATH apuntando a servicios/
+from comun.metricas import Counter, Gauge, Histogram
+
+## ----------------------------------------------------------------
+## MÉTRICAS DE FRAMES
+## ----------------------------------------------------------------
+FRAMES_CONSUMED = Counter('frames_consumed_total', 'Frames recibidos desde RabbitMQ', ['camera'])
+FRAMES_PROCESSED = Counter('frames_processed_total', 'Frames que pasaron por la inferencia', ['camera'])
+FRAMES_SKIPPED = Counter('frames_motion_skipped_total', 'Frames sin movimiento que no pasaron por el modelo',
+                         ['camera'])
+FRAMES_DROPPED = Counter('frames_dropped_total', 'Frames descartados sin inferencia', ['camera', 'reason'])
+FRAMES_LOST = Counter('frames_lost_total', 'Frames que el emisor publicó y no llegaron (saltos de seq)', ['camera'])
+FRAME_AGE = Histogram('frame_age_seconds', 'Tiempo desde la captura hasta el ack', ['camera'])
+CLIP_FRAMES_DROPPED = Counter('clip_frames_dropped_total', 'Frames que no entraron a la cola del grabador', ['camera'])
+
+#Duración de cada etapa (solo el trabajo, sin la espera en colas). Sin etiqueta
+#de cámara: infer es por lote y así la cantidad de series no crece con las cámaras
+STAGE_SECONDS = Histogram('stage_seconds', 'Duración de cada etapa del pipeline', ['stage'],
+                          buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+QUEUE_DEPTH = Gauge('queue_depth', 'Mensajes esperando en cada cola', ['queue'])
+ACTIVE_SESSIONS = Gauge('active_sessions', 'Cámaras con sesión abierta')
+ACTIVE_TRACKS = Gauge('active_tracks', 'Personas seguidas por cámara', ['camera'])
+TRACKS_OVERFLOW = Counter('tracks_overflow_total', 'IDs del tracker que no entraron en la tabla de tracks (TRACK_CAPACITY)',
+                          ['camera'])
+
+
+def skip_ratios():
+    #Fracción de frames por cámara que el filtro de movimiento evitó inferir
+    ratios = {}
+    for labels, skipped in FRAMES_SKIPPED.snapshot().items():
+        total = skipped + FRAMES_PROCESSED.get(*labels)
+        if total:
+            ratios[labels[0]] = skipped / total
+    return ratios
+
+
+## ----------------------------------------------------------------
+## MÉTRICAS DE ALERTAS
+## ----------------------------------------------------------------
+ALERT_FRAMES = Counter('alert_frames_total', 'Frames con al menos una persona en alerta', ['camera'])
+INCIDENT_EVENTS = Counter('incident_events_total', 'Eventos de incidente publicados', ['camera', 'event'])
@@ -0,0 +1,42 @@
+# --- IMPORTS ---
+import cv2
+
+## ----------------------------------------------------------------
+## FILTRO DE MOVIMIENTO ANTES DE LA INFERENCIA
+## ----------------------------------------------------------------
+#Se compara una miniatura en escala de grises contra la del último frame que
+#pasó por YOLO. Si casi ningún píxel cambió, la escena está quieta y se
+#reutilizan los tracks anteriores. Comparar contra el último frame inferido (y
+#no contra el inmediatamente anterior) evita que un movimiento lento se cuele
+#de a poco sin superar nunca el umbral.
+THUMB_SIZE = (160, 120)
+
+
+def make_thumbnail(frame):
+    small = cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(gray, (5, 5), 0)
+
+
+class MotionGate:
+    def __init__(self, pixel_threshold, min_changed_fraction, keyframe_interval):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = int(min_changed_fraction * THUMB_SIZE[0] * THUMB_SIZE[1])
+        self.keyframe_interval = keyframe_interval
+        self.reference = None
+        self.since_inference = 0
+
+    def should_infer(self, thumbnail):
+        #Siempre se infiere el primer frame y, como mínimo, uno cada keyframe_interval
+        infer = self.reference is None or self.since_inference + 1 >= self.keyframe_interval
+        if not infer:
+            diff = cv2.absdiff(thumbnail, self.reference)
+            _, changed = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            infer = cv2.countNonZero(changed) >= self.min_changed
+
+        if infer:
+            self.reference = thumbnail
+            self.since_inference = 0
+        else:
+            self.since_inference += 1
+        return infer
@@ -0,0 +1,354 @@
+# --- IMPORTS ---
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import (ANNOTATE_WORKERS, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, CLIP_QUEUE_SIZE, DECODE_WORKERS,
+                    INCIDENT_TRACK_WINDOW_SECONDS, INCIDENT_UPDATE_SECONDS, INCIDENT_WINDOW_SECONDS,
+                    LIVE_MODE, MAX_CLIP_SECONDS, MAX_FRAME_AGE_MS, MOTION_GATE, OUTPUT_DIR,
+                    PIPELINE_CAPACITY, RECORDING_SECONDS, VIDEO_FPS, VIDEO_HEIGHT, VIDEO_WIDTH)
+from grabador import ClipRecorder
+from incidentes import IncidentAggregator
+from lotes import collect_batch
+from metricas import (ALERT_FRAMES, FRAME_AGE, FRAMES_CONSUMED, FRAMES_DROPPED, FRAMES_LOST, FRAMES_PROCESSED,
+                      FRAMES_SKIPPED, QUEUE_DEPTH, STAGE_SECONDS)
+from movimiento import make_thumbnail
+
+#Marcador para detener las etapas
+_STOP = object()
+
+
+## ----------------------------------------------------------------
+## TRABAJO QUE RECORRE LAS ETAPAS
+## ----------------------------------------------------------------
+class FrameJob:
+    __slots__ = ('camera_id', 'body', 'token', 'session', 'captured_at', 'seq', 'frame', 'slot', 'thumbnail',
+                 'detections', 'skipped', 'submitted_at', 'decoded_at', 'inferred_at', 'finished_at', 'stages')
+
+    def __init__(self, camera_id, body, token, session, captured_at=None, seq=None):
+        self.camera_id = camera_id
+        #JPEG: bytes o memoryview dentro del cuerpo del mensaje (comun/sobre.py)
+        self.body = body
+        #Lo que necesite quien consume para confirmar el mensaje (delivery_tag)
+        self.token = token
+        self.session = session
+        #Hora de captura en la cámara (epoch), si el emisor la envía
+        self.captured_at = captured_at
+        #Número de frame del emisor, si vino en el sobre
+        self.seq = seq
+        self.frame = None
+        #Arreglo del anillo de la sesión donde quedó el frame, si se redimensionó
+        self.slot = None
+        self.thumbnail = None
+        self.detections = None
+        #True si el filtro de movimiento decidió no pasar el frame por el modelo
+        self.skipped = False
+        #Marcas de tiempo (perf_counter) al salir de cada etapa, para medir latencias
+        self.submitted_at = time.perf_counter()
+        self.decoded_at = None
+        self.inferred_at = None
+        self.finished_at = None
+        #Duración de cada etapa que pasó este frame (decode, infer, track,
+        #heuristic, record), sin las esperas en colas
+        self.stages = {}
+
+
+def draw_detections(frame, current_frame_detections, alert_ids):
+    #Destacar personas en cuadro verde y agresiones en cuadro rojo
+    for track_id, data in current_frame_detections.items():
+        x1, y1, x2, y2 = data['box']
+        label = f'Persona {track_id}'
+
+        if track_id in alert_ids:
+            color = (0, 0, 255)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
+            cv2.putText(frame, label + " [ALERTA]", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        else:
+            color = (0, 255, 0)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+
+## ----------------------------------------------------------------
+## PIPELINE DECODIFICAR -> INFERIR -> ANOTAR/GRABAR
+## ----------------------------------------------------------------
+class Pipeline:
+    #decode: pool de hilos (imdecode/resize liberan el GIL).
+    #infer: un hilo que toma los frames en orden de llegada y los agrupa en lotes.
+    #annotate: N hilos; cada cámara va siempre al mismo, así su tracker y su
+    #grabación reciben los frames en orden.
+    #on_done(job) se llama cuando el frame terminó todas las etapas (para el ack);
+    #publish_alert(camera_id, mensaje) y preview (vista.PreviewServer) son opcionales.
+    #live activa los descartes de latest-frame-wins y max_frame_age_ms el de
+    #frames viejos (0 = sin límite); por defecto los de config.
+
+    def __init__(self, detector, sessions, on_done, publish_alert=None, preview=None, output_dir=OUTPUT_DIR,
+                 live=LIVE_MODE, max_frame_age_ms=MAX_FRAME_AGE_MS):
+        self.detector = detector
+        self.sessions = sessions
+        self.on_done = on_done
+        self.publish_alert = publish_alert
+        self.preview = preview
+        self.live = live
+        self.max_frame_age_ms = max_frame_age_ms
+
+        self.decode_pool = ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix='decode')
+        self.infer_queue = queue.Queue(maxsize=PIPELINE_CAPACITY)
+        self.worker_queues = [queue.Queue(maxsize=PIPELINE_CAPACITY) for _ in range(ANNOTATE_WORKERS)]
+        self.threads = [threading.Thread(target=self._inference_loop, name='infer', daemon=True)]
+        self.threads += [threading.Thread(target=self._worker_loop, args=(q,), name=f'annotate-{i}', daemon=True)
+                         for i, q in enumerate(self.worker_queues)]
+        self.recorder = ClipRecorder(output_dir, VIDEO_FPS, (VIDEO_WIDTH, VIDEO_HEIGHT),
+                                     CLIP_QUEUE_SIZE, MAX_CLIP_SECONDS)
+        #Las alertas se publican agrupadas en incidentes, no una por frame
+        self.incidents = None
+        if publish_alert is not None:
+            self.incidents = IncidentAggregator(publish_alert, INCIDENT_WINDOW_SECONDS,
+                                                INCIDENT_TRACK_WINDOW_SECONDS, INCIDENT_UPDATE_SECONDS)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        #Termina de procesar lo que ya entró y detiene los hilos
+        self.infer_queue.put(_STOP)
+        for thread in self.threads:
+            thread.join()
+        self.decode_pool.shutdown()
+
+    def load(self):
+        #Fracción de la capacidad ocupada por frames esperando en las etapas
+        infer_waiting = self.infer_queue.qsize()
+        annotate_waiting = sum(q.qsize() for q in self.worker_queues)
+        QUEUE_DEPTH.set(infer_waiting, 'infer')
+        QUEUE_DEPTH.set(annotate_waiting, 'annotate')
+        waiting = infer_waiting + annotate_waiting
+        return min(1.0, waiting / PIPELINE_CAPACITY)
+
+    def submit(self, camera_id, body, token, captured_at=None, seq=None):
+        #Con prefetch <= PIPELINE_CAPACITY esta cola nunca se llena, así que el
+        #hilo de la conexión no se bloquea aquí.
+        FRAMES_CONSUMED.inc(camera_id)
+        session = self.sessions.acquire(camera_id)
+        if seq is not None:
+            #Los frames de una cámara llegan en orden: un salto es lo que se perdió
+            #entre el emisor y este nodo (anillo lleno, cola del broker acotada).
+            #Un seq menor significa que el emisor se reinició.
+            if session.last_seq is not None and seq > session.last_seq + 1:
+                FRAMES_LOST.inc(camera_id, amount=seq - session.last_seq - 1)
+            session.last_seq = seq
+        job = FrameJob(camera_id, body, token, session, captured_at, seq)
+        self.infer_queue.put(self.decode_pool.submit(self._decode, job))
+
+    def _finish(self, job):
+        if job.slot is not None:
+            job.session.frames.release(job.slot)
+        job.frame = job.slot = job.body = None
+        self.sessions.release(job.session)
+        if job.captured_at is not None:
+            FRAME_AGE.observe(max(0.0, time.time() - job.captured_at), job.camera_id)
+        job.finished_at = time.perf_counter()
+        self.on_done(job)
+
+    def _observe(self, job, stage, seconds):
+        job.stages[stage] = seconds
+        STAGE_SECONDS.observe(seconds, stage)
+
+    def _drop(self, job, reason):
+        FRAMES_DROPPED.inc(job.camera_id, reason)
+        self._finish(job)
+
+    ## --- Etapa 1: decodificación ---
+    def _decode(self, job):
+        #np.frombuffer no copia el cuerpo del mensaje (tampoco el memoryview
+        #del sobre); el JPEG se conserva para el búfer pre-evento
+        #Un cuerpo vacío o corrupto deja job.frame en None: una excepción aquí
+        #saldría por future.result() y mataría el hilo de inferencia
+        started = time.perf_counter()
+        try:
+            nparr = np.frombuffer(job.body, np.uint8)
+            frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR) if len(nparr) else None
+            if frame is not None:
+                #El emisor ya suele enviar la resolución de trabajo; si no, se
+                #redimensiona dentro de un arreglo reutilizable de la sesión
+                if frame.shape[1] != VIDEO_WIDTH or frame.shape[0] != VIDEO_HEIGHT:
+                    job.slot = job.session.frames.acquire()
+                    frame = cv2.resize(frame, (VIDEO_WIDTH, VIDEO_HEIGHT), dst=job.slot)
+                job.frame = frame
+                if MOTION_GATE:
+                    job.thumbnail = make_thumbnail(frame)
+        except Exception as e:
+            print(f"--- [PROCESAMIENTO] Frame de '{job.camera_id}' no decodificable: {e} ---")
+            job.frame = job.thumbnail = None
+        job.decoded_at = time.perf_counter()
+        self._observe(job, 'decode', job.decoded_at - started)
+        return job
+
+    ## --- Etapa 2: inferencia en lote ---
+    def _inference_loop(self):
+        stopped = False
+        while not stopped:
+            futures, stopped = collect_batch(self.infer_queue, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, stop=_STOP)
+            if self.live and not stopped:
+                stopped = self._drain(futures)
+            #Los frames que no se pudieron decodificar se confirman y descartan aquí
+            jobs = []
+            for future in futures:
+                job = future.result()
+                if job.frame is None:
+                    self._drop(job, 'decode_error')
+                else:
+                    jobs.append(job)
+            if self.live:
+                jobs = self._latest_per_camera(jobs)
+
+            #En modo en vivo el drenado puede juntar más de un lote
+            for start in range(0, len(jobs), BATCH_MAX_SIZE):
+                self._infer(jobs[start:start + BATCH_MAX_SIZE])
+
+        for q in self.worker_queues:
+            q.put(_STOP)
+
+    def _drain(self, futures):
+        #Sumar al lote todo lo que ya está esperando, sin bloquear
+        while True:
+            try:
+                item = self.infer_queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is _STOP:
+                return True
+            futures.append(item)
+
+    def _latest_per_camera(self, jobs):
+        #Latest-frame-wins: de cada cámara solo sigue el frame más nuevo
+        newest = {}
+        for job in jobs:
+            previous = newest.get(job.camera_id)
+            if previous is not None:
+                self._drop(previous, 'superseded')
+            newest[job.camera_id] = job
+
+        kept = []
+        now = time.time()
+        max_age = self.max_frame_age_ms
+        for job in newest.values():
+            too_old = (max_age > 0 and job.captured_at is not None
+                       and (now - job.captured_at) * 1000.0 > max_age)
+            if too_old:
+                self._drop(job, 'stale')
+            else:
+                kept.append(job)
+        return kept
+
+    def _infer(self, jobs):
+        #El filtro de movimiento va aquí y no en la decodificación porque este
+        #hilo ve los frames de cada cámara en orden
+        valid = []
+        for job in jobs:
+            if job.thumbnail is not None and not job.session.motion.should_infer(job.thumbnail):
+                job.skipped = True
+            else:
+                valid.append(job)
+
+        if valid:
+            try:
+                started = time.perf_counter()
+                detections = self.detector.detect([job.frame for job in valid])
+                elapsed = time.perf_counter() - started
+                STAGE_SECONDS.observe(elapsed, 'infer')
+                for job, det in zip(valid, detections):
+                    job.detections = det
+                    job.stages['infer'] = elapsed
+            except Exception:
+                print("--- [PROCESAMIENTO] Error en la inferencia del lote: ---")
+                traceback.print_exc()
+        inferred_at = time.perf_counter()
+        for job in jobs:
+            job.inferred_at = inferred_at
+            self.worker_queues[hash(job.camera_id) % len(self.worker_queues)].put(job)
+
+    ## --- Etapa 3: tracking, heurística, anotación y grabación ---
+    def _worker_loop(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is _STOP:
+                break
+            try:
+                if job.detections is not None:
+                    self._handle(job)
+                    FRAMES_PROCESSED.inc(job.camera_id)
+                elif job.skipped:
+                    self._handle(job)
+                    FRAMES_SKIPPED.inc(job.camera_id)
+                else:
+                    #Falló la inferencia del lote (ver _infer): el frame se pierde
+                    FRAMES_DROPPED.inc(job.camera_id, 'infer_error')
+            except Exception:
+                FRAMES_DROPPED.inc(job.camera_id, 'error')
+                print(f"--- [PROCESAMIENTO] Error procesando un frame de '{job.camera_id}': ---")
+                traceback.print_exc()
+            finally:
+                self._finish(job)
+
+    def _handle(self, job):
+        session = job.session
+        camera_id = job.camera_id
+        frame = job.frame
+        session.frame_buffer.append(job.body)
+
+        if job.skipped:
+            #Escena quieta: se dibujan los tracks del último frame inferido
+            current_frame_detections, alert_ids = session.last_detections, set()
+        else:
+            started = time.perf_counter()
+            tracks = session.track(frame, job.detections)
+            tracked = time.perf_counter()
+            #Con sobre, la heurística usa la hora de captura: las velocidades
+            #salen del intervalo real entre frames y no del jitter de llegada
+            frame_time = job.captured_at if job.captured_at is not None else time.time()
+            current_frame_detections, alert_ids = session.analyze(tracks, frame_time)
+            self._observe(job, 'track', tracked - started)
+            self._observe(job, 'heuristic', time.perf_counter() - tracked)
+
+        #Grabación e incidente. Una alerta durante un clip lo extiende; el
+        #agregador decide si la alerta abre, actualiza o no publica nada
+        now = time.time()
+        if alert_ids:
+            ALERT_FRAMES.inc(camera_id)
+            if session.clip is None:
+                session.clip = self.recorder.start(camera_id, session.frame_buffer, alert_ids, RECORDING_SECONDS)
+                print(f"--- [ALERTA DETECTADA] Empezando a grabar en {session.clip.filename} ---")
+            else:
+                session.clip.extend(now + RECORDING_SECONDS, alert_ids)
+            if self.incidents is not None:
+                self.incidents.observe(camera_id, alert_ids, current_frame_detections, session.alert_reasons,
+                                       os.path.basename(session.clip.filename), now)
+
+        #Las anotaciones solo se dibujan si alguien va a ver el frame (un clip o
+        #un espectador de la vista previa), y sobre el lienzo de la sesión para
+        #no tocar el frame decodificado
+        show = self.preview is not None and self.preview.wants(camera_id)
+        if session.clip is None and not show:
+            return
+        started = time.perf_counter()
+        annotated = session.canvas.draw_from(frame)
+        draw_detections(annotated, current_frame_detections, alert_ids)
+
+        #Si hay un clip abierto, el frame va a la cola del grabador
+        if session.clip is not None:
+            session.clip.add(annotated)
+            if session.clip.is_due(now):
+                session.clip.close()
+                session.clip = None
+        self._observe(job, 'record', time.perf_counter() - started)
+
+        if show:
+            self.preview.publish(camera_id, annotated)
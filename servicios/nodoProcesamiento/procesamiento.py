@@ -1,58 +1,52 @@
 # --- IMPORTS ---
-import cv2
 import pika
-import numpy as np
-from ultralytics import YOLO
+from config import (ALERTS_QUEUE, BATCH_MAX_SIZE, CA_CERT_PATH, CLIENT_CERT_PATH, CLIENT_KEY_PATH,
+                    CONTROL_EXCHANGE, CONTROL_INTERVAL_SECONDS, DETECTOR_BACKEND, DETECTOR_CONF,
+                    DETECTOR_IMGSZ, DETECTOR_IOU, DETECTOR_THREADS, FRAME_QUEUE_ARGUMENTS, FRAME_ROUTING,
+                    METRICS_HOST, METRICS_PORT, METRICS_REPORT_SECONDS, MODEL_CACHE_DIR, MODEL_WEIGHTS,
+                    NODE_HEARTBEAT_SECONDS, NODE_ID, PIPELINE_CAPACITY, PREVIEW_ENABLED, PREVIEW_FPS,
+                    PREVIEW_HOST, PREVIEW_PORT, PREVIEW_QUALITY, PREVIEW_WIDTH, PRE_EVENT_BUFFER_SIZE,
+                    QUEUE_NAME, RABBITMQ_HOST, RABBITMQ_PORT, SESSION_IDLE_SECONDS, SHARD_COUNT, VIDEO_FPS,
+                    VIDEO_HEIGHT, VIDEO_WIDTH)
+from coordinador import ShardCoordinator
+from detectores import load_detector
+from comun.metricas import start_metrics_server, summary
+import metricas
+from pipeline import Pipeline
+from sesiones import SessionManager
+from comun import sobre
+from vista import PreviewServer
+import functools
+import signal
 import time
-import os
-from collections import defaultdict, deque
-import traceback
+import uuid
 import ssl
 import json
 
 print("--- [PROCESAMIENTO] Script iniciado. ---")
 
-#Cargar el modelo de IA (YOLOv8) ---
-print("--- [PROCESAMIENTO] Cargando modelo de IA... ---")
-model = YOLO('yolov8n.pt')
-print("--- [PROCESAMIENTO] Modelo cargado exitosamente. ---")
-
-#Parámetros para el modelo
-SPEED_THRESHOLD = 50
-PROXIMITY_THRESHOLD = 50
-tracked_people = defaultdict(lambda: {'last_pos': None, 'last_time': None, 'is_alert': False})
-
-# Parámetros del video a guardar
-VIDEO_FPS = 10.0
-VIDEO_WIDTH = 640
-VIDEO_HEIGHT = 480
-RECORDING_SECONDS = 5
-
-#Búfer para guardar los segundos previos al evento
-PRE_EVENT_BUFFER_SECONDS = 3
-buffer_size = int(VIDEO_FPS * PRE_EVENT_BUFFER_SECONDS)
-frame_buffer = deque(maxlen=buffer_size)
-
-#Variables para controlar el estado de la grabación
-is_recording = False
-recording_end_time = 0
-video_writer = None
-
-#Asegurarse de que la carpeta de salida exista
-os.makedirs('output', exist_ok=True)
+#Cargar el modelo de IA (YOLOv8) en el backend elegido, solo la clase persona,
+#y calentarlo con lotes de 1 y de BATCH_MAX_SIZE antes de consumir frames
+print(f"--- [PROCESAMIENTO] Cargando modelo de IA ({DETECTOR_BACKEND}, {DETECTOR_IMGSZ}px)... ---")
+started = time.perf_counter()
+try:
+    detector = load_detector(DETECTOR_BACKEND, MODEL_WEIGHTS, DETECTOR_IMGSZ, DETECTOR_THREADS, DETECTOR_CONF,
+                             DETECTOR_IOU, MODEL_CACHE_DIR)
+except Exception as e:
+    print(f"--- [PROCESAMIENTO] Error fatal cargando el modelo: {e} ---")
+    exit(1)
+loaded = time.perf_counter() - started
+warmup = detector.warmup(VIDEO_WIDTH, VIDEO_HEIGHT, sorted({1, BATCH_MAX_SIZE}))
+print(f"--- [PROCESAMIENTO] Modelo cargado en {loaded:.1f} s y calentado en {warmup:.1f} s. ---")
+
+sessions = SessionManager(
+    SESSION_IDLE_SECONDS,
+    fps=VIDEO_FPS, width=VIDEO_WIDTH, height=VIDEO_HEIGHT, buffer_size=PRE_EVENT_BUFFER_SIZE)
 print("--- [PROCESAMIENTO] Variables de grabación inicializadas. ---")
 
 ## ----------------------------------------------------------------
 ## CONFIGURACIÓN DE CONEXIÓN TLS
 ## ----------------------------------------------------------------
-print("--- [PROCESAMIENTO] Leyendo configuración de entorno... ---")
-RABBITMQ_HOST = os.getenv('RABBITMQ_HOST', 'localhost')
-RABBITMQ_PORT = int(os.getenv('RABBITMQ_PORT', 5671))
-QUEUE_NAME = 'camera_frames'
-CA_CERT_PATH = os.getenv('CA_CERT')
-CLIENT_CERT_PATH = os.getenv('CLIENT_CERT')
-CLIENT_KEY_PATH = os.getenv('CLIENT_KEY')
-
 print(f"--- [PROCESAMIENTO] Host: {RABBITMQ_HOST}, Puerto: {RABBITMQ_PORT} ---")
 
 ssl_options = None
@@ -97,145 +91,150 @@ print("--- [PROCESAMIENTO] ¡Conexión exitosa con RabbitMQ! ---")
 ## ----------------------------------------------------------------
 ## LÓGICA DE DETECCIÓN, GRABACIÓN Y LOG
 ## ----------------------------------------------------------------
+#Las etapas del pipeline corren en otros hilos; todo lo que toca el canal
+#(acks y publicación de alertas) se devuelve al hilo de la conexión.
+def ack_frame(job):
+    connection.add_callback_threadsafe(functools.partial(channel.basic_ack, delivery_tag=job.token))
+
+
+def _publish_alert(camera_id, alert_message):
+    try:
+        #message_id permite al servidor de logs reconocer una alerta reentregada
+        props = pika.BasicProperties(
+            app_id=camera_id,
+            message_id=uuid.uuid4().hex,
+            delivery_mode=2,
+            content_type='text'
+        )
+
+        #Publicamos el mensaje a una nueva cola dedicada para alertas
+        channel.basic_publish(
+            exchange='',
+            routing_key=ALERTS_QUEUE,
+            body=json.dumps(alert_message),
+            properties=props
+        )
+        print(f"--- [ALERTA ENVIADA] {alert_message['alert_type']} enviado al servidor de logs. ---")
+    except Exception as e:
+        print(f"--- [ERROR] No se pudo enviar la alerta a RabbitMQ: {e} ---")
+
+
+def publish_alert(camera_id, alert_message):
+    connection.add_callback_threadsafe(functools.partial(_publish_alert, camera_id, alert_message))
+
+
+def publish_load():
+    #Carga = lo más alto entre el pipeline ocupado y la cola de RabbitMQ llena.
+    #La cola solo tiene largo máximo en modo en vivo (x-max-length); sin límite
+    #no hay "llena" y cuenta solo el pipeline
+    backlog = channel.queue_declare(queue=frames_queue, passive=True).method.message_count
+    metricas.QUEUE_DEPTH.set(backlog, 'broker')
+    max_length = (FRAME_QUEUE_ARGUMENTS or {}).get('x-max-length', 0)
+    load = pipeline.load()
+    if max_length > 0:
+        load = max(load, min(1.0, backlog / max_length))
+    message = {'node_id': NODE_ID, 'load': load, 'backlog': backlog}
+    if coordinator is not None:
+        #Con shards, cada cámara mira solo la carga del nodo dueño de su shard
+        message['shards'] = sorted(coordinator.owned)
+    channel.basic_publish(exchange=CONTROL_EXCHANGE, routing_key='', body=json.dumps(message))
+
+
 def callback(ch, method, properties, body):
-    global tracked_people, frame_buffer, is_recording, recording_end_time, video_writer
+    #Sobre binario (comun/sobre.py) o, de emisores viejos, el JPEG solo con la hora
+    #de captura en los headers. El JPEG del sobre es un memoryview: no se copia.
+    try:
+        envelope = sobre.unpack(body)
+    except ValueError as e:
+        print(f"--- [PROCESAMIENTO] Frame descartado: {e} ---")
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    if envelope is not None:
+        pipeline.submit(envelope.camera_id, envelope.jpeg, method.delivery_tag,
+                        captured_at=envelope.captured_at, seq=envelope.seq)
+        return
     camera_id = properties.app_id if properties and properties.app_id else "Cámara desconocida"
-    
-    #Lógica del modelo de IA, detectar y destacar personas en cuadro verde y agresiones en cuadro rojo
-    nparr = np.frombuffer(body, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    if frame is not None:
-        current_time = time.time()
-        frame = cv2.resize(frame, (VIDEO_WIDTH,VIDEO_HEIGHT))
-        frame_buffer.append(frame.copy())
-        results = model.track(frame, persist=True, verbose=False)
-
-        current_frame_detections = {}
-        alert_ids = set()
-
-        if results[0].boxes.id is not None:
-            boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
-            ids = results[0].boxes.id.cpu().numpy().astype(int)
-            classes = results[0].boxes.cls.cpu().numpy().astype(int)
-
-            for box, track_id, cls in zip(boxes, ids, classes):
-                if model.names[cls].lower() == 'person':
-                    x1, y1, x2, y2 = box
-                    center_x, center_y = int((x1 + x2) / 2), int((y1 + y2) / 2)
-                    current_pos = (center_x, center_y)
-                    current_frame_detections[track_id] = {'pos': current_pos, 'box': box}
-                    
-                    if tracked_people[track_id]['last_pos'] is not None:
-                        last_pos = tracked_people[track_id]['last_pos']
-                        distance = np.linalg.norm(np.array(current_pos) - np.array(last_pos))
-                        if distance > SPEED_THRESHOLD:
-                            alert_ids.add(track_id)
-                    
-                    tracked_people[track_id]['last_pos'] = current_pos
-                    tracked_people[track_id]['last_time'] = current_time
-
-            detected_ids = list(current_frame_detections.keys())
-            if len(detected_ids) > 1:
-                for i in range(len(detected_ids)):
-                    for j in range(i + 1, len(detected_ids)):
-                        id1, id2 = detected_ids[i], detected_ids[j]
-                        pos1 = np.array(current_frame_detections[id1]['pos'])
-                        pos2 = np.array(current_frame_detections[id2]['pos'])
-                        distance = np.linalg.norm(pos1 - pos2)
-                        if distance < PROXIMITY_THRESHOLD:
-                            alert_ids.add(id1)
-                            alert_ids.add(id2)
-        
-        for track_id, data in current_frame_detections.items():
-            x1, y1, x2, y2 = data['box']
-            label = f'Persona {track_id}'
-            
-            if track_id in alert_ids:
-                color = (0, 0, 255)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
-                cv2.putText(frame, label + " [ALERTA]", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-            else:
-                color = (0, 255, 0)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-        stale_ids = [tid for tid, data in tracked_people.items() if current_time - data['last_time'] > 5]
-        for tid in stale_ids:
-            del tracked_people[tid]
-        
-        #Envío de alerta y grabación
-        if alert_ids and not is_recording:
-            try:
-                alert_message = {
-                    "timestamp": time.time(),
-                    "alert_type": "AGGRESSION_DETECTED"
-                }
-                alert_body = json.dumps(alert_message)
-
-                props = pika.BasicProperties(
-                    app_id=camera_id,
-                    delivery_mode=2,
-                    content_type='text'
-                )
-
-                #Publicamos el mensaje a una nueva cola dedicada para alertas
-                ch.basic_publish(
-                    exchange='',
-                    routing_key='alerts_log',
-                    body=alert_body,
-                    properties=props
-                )
-                print(f"--- [ALERTA ENVIADA] Notificación enviada al servidor de logs. ---")
-            except Exception as e:
-                print(f"--- [ERROR] No se pudo enviar la alerta a RabbitMQ: {e} ---")
-
-            #Grabación
-            is_recording = True
-            recording_end_time = time.time() + RECORDING_SECONDS
-            
-            #Crear un nombre de archivo único
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            filename = f"output/agresion-{timestamp}-{camera_id}.avi"
-            
-            #Inicializar el escritor de video
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            video_writer = cv2.VideoWriter(filename, fourcc, VIDEO_FPS, (VIDEO_WIDTH, VIDEO_HEIGHT))
-            
-            print(f"--- [ALERTA DETECTADA] Empezando a grabar en {filename} ---")
-            
-            #Escribir los frames del búfer (el pre-evento)
-            for f in frame_buffer:
-                video_writer.write(f)
-
-        #Si estamos en modo grabación, seguimos escribiendo frames
-        if is_recording:
-            video_writer.write(frame)
-            
-            #Si ya pasaron los 5 segundos, detenemos la grabación
-            if time.time() >= recording_end_time:
-                is_recording = False
-                video_writer.release()
-                video_writer = None
-                print(f"--- [GRABACIÓN FINALIZADA] Video guardado. ---")
-
-        #Mostramos el video en pantalla
-        cv2.imshow(f"Frames recibidos de: '{camera_id}'", frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            channel.stop_consuming()
-    
-    ch.basic_ack(delivery_tag=method.delivery_tag)
-#Consumir mensajes de la cola
-channel.basic_consume(queue=QUEUE_NAME, on_message_callback=callback)
+    headers = properties.headers if properties and properties.headers else {}
+    pipeline.submit(camera_id, body, method.delivery_tag, captured_at=headers.get('capture_ts'))
+
+
+#Sin ventanas: la vista previa, si está activada, se sirve por HTTP
+preview = None
+if PREVIEW_ENABLED:
+    preview = PreviewServer(PREVIEW_HOST, PREVIEW_PORT, PREVIEW_FPS, PREVIEW_WIDTH, PREVIEW_QUALITY,
+                            cameras=sessions.camera_ids)
+    preview.start()
+
+pipeline = Pipeline(detector, sessions, ack_frame, publish_alert=publish_alert, preview=preview)
+
+#Métricas en formato Prometheus en http://host:METRICS_PORT/metrics
+start_metrics_server(METRICS_HOST, METRICS_PORT)
+print(f"--- [PROCESAMIENTO] Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics ---")
+
+#Consumir mensajes de la cola. El prefetch limita cuántos frames sin confirmar
+#hay dentro del pipeline: esa es la contrapresión hacia RabbitMQ.
+coordinator = None
+if FRAME_ROUTING == 'shard':
+    #Cola propia del nodo, enlazada solo a los shards de cámaras que le tocan
+    coordinator = ShardCoordinator(channel, NODE_ID, f"{QUEUE_NAME}.{NODE_ID}", SHARD_COUNT,
+                                   NODE_HEARTBEAT_SECONDS, queue_arguments=FRAME_QUEUE_ARGUMENTS)
+    coordinator.start()
+    frames_queue = coordinator.queue_name
+    print(f"--- [PROCESAMIENTO] Modo shard: nodo '{NODE_ID}', cola '{frames_queue}'. ---")
+else:
+    channel.queue_declare(queue=QUEUE_NAME, durable=True, arguments=FRAME_QUEUE_ARGUMENTS)
+    frames_queue = QUEUE_NAME
+channel.exchange_declare(exchange=CONTROL_EXCHANGE, exchange_type='fanout')
+channel.basic_qos(prefetch_count=PIPELINE_CAPACITY)
+channel.basic_consume(queue=frames_queue, on_message_callback=callback)
+pipeline.start()
+EVICTION_INTERVAL = 5.0
+next_eviction = time.monotonic() + EVICTION_INTERVAL
+next_report = time.monotonic() + METRICS_REPORT_SECONDS
+next_control = time.monotonic()
+#docker stop manda SIGTERM: cerrar igual que con Ctrl+C
+def stop_on_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+signal.signal(signal.SIGTERM, stop_on_sigterm)
 try:
-    channel.start_consuming()
+    while True:
+        connection.process_data_events(time_limit=0.02)
+        if coordinator is not None:
+            coordinator.tick()
+
+        pipeline.incidents.expire()
+
+        if time.monotonic() >= next_eviction:
+            sessions.evict_idle()
+            next_eviction = time.monotonic() + EVICTION_INTERVAL
+
+        if time.monotonic() >= next_control:
+            publish_load()
+            next_control = time.monotonic() + CONTROL_INTERVAL_SECONDS
+
+        #Frames consumidos/descartados y edad de los frames, por cámara
+        if time.monotonic() >= next_report:
+            for camera_id, ratio in sorted(metricas.skip_ratios().items()):
+                print(f"--- [MÉTRICAS] motion_skip_ratio{{camera={camera_id}}} {ratio:.2f} ---")
+            for line in summary():
+                print(f"--- [MÉTRICAS] {line} ---")
+            next_report = time.monotonic() + METRICS_REPORT_SECONDS
 except KeyboardInterrupt:
     print("Consumo interrumpido.")
 finally:
-    if 'connection' in locals() and connection.is_open:
+    #Terminar los frames que ya estaban dentro y enviar sus acks antes de cerrar
+    pipeline.stop()
+    pipeline.incidents.close_all()
+    if coordinator is not None and connection.is_open:
+        coordinator.stop()
+    if connection.is_open:
+        connection.process_data_events(time_limit=0)
         connection.close()
-    cv2.destroyAllWindows()
-     # >> NUEVO: Asegurarse de cerrar el archivo de video si el script se detiene
-    if video_writer is not None:
-        video_writer.release()
-        print("--- [PROCESAMIENTO] Grabación de video finalizada por cierre de script. ---")
\ No newline at end of file
+    if preview is not None:
+        preview.stop()
+     # >> NUEVO: Asegurarse de cerrar los archivos de video si el script se detiene
+    sessions.close_all()
+    pipeline.recorder.shutdown()
+    print("--- [PROCESAMIENTO] Grabaciones de video finalizadas por cierre de script. ---")
@@ -0,0 +1,232 @@
+# --- IMPORTS ---
+import math
+
+## ----------------------------------------------------------------
+## TABLA DE TRACKS POR CÁMARA
+## ----------------------------------------------------------------
+#Reemplaza al defaultdict tracked_people. La tabla reserva al crearse un
+#arreglo de `capacity` registros (Track, con __slots__) y los reutiliza: cada
+#persona ocupa uno con su última posición, la velocidad suavizada en px/s, la
+#hora en que se la vio y un anillo fijo con sus últimas `history` posiciones.
+#El dict solo lleva del track_id del tracker a su registro. update() hace un
+#lookup y unas cuantas operaciones de float por ID del frame; no reserva
+#memoria por track y su costo no depende de cuántos IDs nuevos aparezcan.
+#
+#Velocidad: media exponencial con alpha = 1 - exp(-dt / tau), donde dt es el
+#tiempo real entre frames (hora de captura). Un salto de jitter entre dos
+#frames muy seguidos pesa poco (alpha chico) y un intervalo largo pesa más, así
+#que la velocidad no depende del fps ni de los frames perdidos. La primera
+#muestra de un track no se suaviza: es su velocidad inicial.
+#
+#Vencimiento: rueda de tiempo con casillas de `tick` segundos. Cada track está
+#anotado en la casilla de la hora en que vencería si no se lo vuelve a ver;
+#update() no lo mueve. expire() solo recorre las casillas que ya pasaron: los
+#tracks que siguen vivos se anotan en la casilla de su nuevo vencimiento y los
+#demás se sacan. Cada track se revisa una vez cada stale_seconds, no en cada
+#frame. Con la tabla llena se desaloja recorriendo la rueda desde la próxima
+#casilla (los vistos hace más tiempo), nunca un track que aparece en el frame.
+WHEEL_TICK_SECONDS = 0.25
+
+
+class Track:
+    __slots__ = ('track_id', 'x', 'y', 'vx', 'vy', 'seen', 'ready', 'due', 'life', 'path', 'head', 'count')
+
+    def __init__(self, history):
+        self.track_id = None
+        self.x = self.y = 0.0
+        self.vx = self.vy = 0.0
+        self.seen = 0.0
+        #True desde que tiene velocidad (segunda posición)
+        self.ready = False
+        #Tick de la casilla donde está anotado; None si el registro está libre
+        self.due = None
+        #Sube cada vez que el registro se reutiliza: las anotaciones de la rueda
+        #de un uso anterior dejan de valer
+        self.life = 0
+        #Anillo de posiciones: path[head] es la última, count las escritas
+        self.path = [None] * history
+        self.head = -1
+        self.count = 0
+
+
+class TrackTable:
+    def __init__(self, capacity, history, stale_seconds, velocity_tau, tick=WHEEL_TICK_SECONDS):
+        self.capacity = capacity
+        self.history = history
+        self.stale_seconds = stale_seconds
+        self.velocity_tau = velocity_tau
+        self.tick = tick
+
+        self.records = [Track(history) for _ in range(capacity)]
+        self.free = list(self.records)
+        self.index = {}
+        #Un vencimiento cae como mucho ceil(stale / tick) + 1 casillas adelante:
+        #con una más, dos vencimientos pendientes nunca comparten casilla
+        self.wheel = [[] for _ in range(int(math.ceil(stale_seconds / tick)) + 2)]
+        self.current_tick = None
+        #IDs que no entraron en el último update() por falta de lugar
+        self.overflow = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, track_id):
+        return track_id in self.index
+
+    def update(self, ids, centers, now):
+        #Registra la posición de cada track en este frame. Devuelve las
+        #velocidades suavizadas (px/s) y una máscara de quién ya tiene velocidad.
+        #Si aparecen más IDs nuevos de los que caben (todos los lugares ocupados
+        #por tracks de este mismo frame), los que sobran no se siguen: quedan sin
+        #velocidad y se cuentan en self.overflow
+        ids = ids.tolist() if hasattr(ids, 'tolist') else list(ids)
+        centers = centers.tolist() if hasattr(centers, 'tolist') else centers
+        index = self.index
+        self.overflow = 0
+        new = [track_id for track_id in ids if track_id not in index]
+        if new:
+            self._add(ids, list(dict.fromkeys(new)), now)
+
+        tau = self.velocity_tau
+        history = self.history
+        speeds, has_velocity = [], []
+        for track_id, (x, y) in zip(ids, centers):
+            track = index.get(track_id)
+            if track is None:
+                speeds.append(0.0)
+                has_velocity.append(False)
+                continue
+            elapsed = now - track.seen
+            #Sin posición anterior o visto ya en este instante: no hay muestra
+            if track.count and elapsed > 0:
+                vx = (x - track.x) / elapsed
+                vy = (y - track.y) / elapsed
+                if track.ready:
+                    alpha = -math.expm1(-elapsed / tau)
+                    track.vx += alpha * (vx - track.vx)
+                    track.vy += alpha * (vy - track.vy)
+                else:
+                    #La velocidad arranca en la medida y no en 0, así quien
+                    #entra corriendo se detecta en su primer salto
+                    track.vx, track.vy = vx, vy
+                    track.ready = True
+            track.x, track.y, track.seen = x, y, now
+            track.head = (track.head + 1) % history
+            track.path[track.head] = (x, y)
+            track.count += 1
+            speeds.append(math.hypot(track.vx, track.vy))
+            has_velocity.append(track.ready)
+        return speeds, has_velocity
+
+    def expire(self, now, keep=()):
+        #Saca los tracks no vistos en stale_seconds y devuelve sus IDs. Los de
+        #keep (IDs del frame que se está registrando) no se sacan aunque estén
+        #vencidos: se anotan como vistos ahora
+        now_tick = int(now // self.tick)
+        if self.current_tick is None or now_tick <= self.current_tick:
+            return []
+        #Si pasó más de una vuelta alcanza con recorrer la rueda una vez
+        first = max(self.current_tick + 1, now_tick - len(self.wheel) + 1)
+        self.current_tick = now_tick
+        expired = []
+        for tick in range(first, now_tick + 1):
+            slot = tick % len(self.wheel)
+            bucket = self.wheel[slot]
+            if not bucket:
+                continue
+            self.wheel[slot] = []
+            for track, life in bucket:
+                if track.life != life:
+                    #Desalojado o vencido en un uso anterior del registro
+                    continue
+                if track.track_id in keep:
+                    self._schedule(track, now)
+                elif now - track.seen > self.stale_seconds:
+                    expired.append(track.track_id)
+                    self._release(track)
+                else:
+                    self._schedule(track, track.seen)
+        return expired
+
+    def path(self, track_id):
+        #Últimas posiciones del track, de la más vieja a la más nueva
+        track = self.index.get(track_id)
+        if track is None:
+            return []
+        count = min(track.count, self.history)
+        return [track.path[(track.head - k) % self.history] for k in range(count - 1, -1, -1)]
+
+    def clear(self):
+        for track in list(self.index.values()):
+            self._release(track)
+        self.wheel = [[] for _ in self.wheel]
+        self.current_tick = None
+
+    def _add(self, ids, new, now):
+        #Da un registro a cada ID nuevo. Si no alcanzan los libres primero se
+        #vencen los tracks viejos (sin tocar los del frame) y después se
+        #desalojan los que vencen antes
+        if self.current_tick is None:
+            self.current_tick = int(now // self.tick)
+        if len(new) > len(self.free):
+            present = set(ids)
+            self.expire(now, keep=present)
+            if len(new) > len(self.free):
+                self._evict(len(new) - len(self.free), present)
+            #Los que siguen sin lugar no se siguen en este frame
+            self.overflow = max(len(new) - len(self.free), 0)
+            new = new[:len(self.free)]
+
+        for track_id in new:
+            track = self.free.pop()
+            track.track_id = track_id
+            track.vx = track.vy = 0.0
+            track.seen = now
+            track.ready = False
+            track.head = -1
+            track.count = 0
+            self.index[track_id] = track
+            self._schedule(track, now)
+
+    def _evict(self, count, present):
+        #Recorre la rueda desde la próxima casilla. Quien está anotado antes de
+        #su vencimiento real (se lo vio después) se pasa a su casilla, como en
+        #expire(); el primero que de verdad vence ahí sale
+        evicted = 0
+        for tick in range(self.current_tick + 1, self.current_tick + len(self.wheel)):
+            slot = tick % len(self.wheel)
+            bucket = self.wheel[slot]
+            if not bucket:
+                continue
+            self.wheel[slot] = kept = []
+            for position, entry in enumerate(bucket):
+                if evicted == count:
+                    kept.extend(bucket[position:])
+                    break
+                track, life = entry
+                if track.life != life:
+                    continue
+                if track.track_id in present:
+                    kept.append(entry)
+                elif self._due(track.seen) != track.due:
+                    self._schedule(track, track.seen)
+                else:
+                    self._release(track)
+                    evicted += 1
+            if evicted == count:
+                break
+
+    def _due(self, seen):
+        #Primer tick que empieza después de seen + stale_seconds
+        return int((seen + self.stale_seconds) // self.tick) + 1
+
+    def _schedule(self, track, seen):
+        track.due = self._due(seen)
+        self.wheel[track.due % len(self.wheel)].append((track, track.life))
+
+    def _release(self, track):
+        del self.index[track.track_id]
+        track.track_id = None
+        track.due = None
+        track.life += 1
+        self.free.append(track)
@@ -0,0 +1,143 @@
+# --- IMPORTS ---
+import threading
+import time
+from collections import deque
+
+from buffers import Canvas, FramePool
+from config import (FRAME_SLOTS, KEYFRAME_INTERVAL, MOTION_MIN_CHANGED_FRACTION, MOTION_PIXEL_THRESHOLD,
+                    PROXIMITY_THRESHOLD, SPEED_THRESHOLD, TRACK_CAPACITY, TRACK_HISTORY,
+                    TRACK_STALE_SECONDS, TRACK_VELOCITY_TAU)
+from heuristica import alert_reasons, velocity_alerts
+from lotes import make_tracker
+from metricas import ACTIVE_SESSIONS, ACTIVE_TRACKS, TRACKS_OVERFLOW
+from movimiento import MotionGate
+from seguimiento import TrackTable
+
+
+## ----------------------------------------------------------------
+## ESTADO POR CÁMARA
+## ----------------------------------------------------------------
+class CameraSession:
+    #Todo lo que antes eran variables globales del nodo, pero por cámara:
+    #tracker, personas seguidas, búfer pre-evento y clip en grabación.
+
+    def __init__(self, camera_id, fps, width, height, buffer_size):
+        self.camera_id = camera_id
+        self.fps = fps
+        self.size = (width, height)
+        self.tracker = make_tracker(fps)
+        self.tracks = TrackTable(TRACK_CAPACITY, TRACK_HISTORY, TRACK_STALE_SECONDS, TRACK_VELOCITY_TAU)
+        #El búfer pre-evento guarda los JPEG tal como llegaron, no arreglos BGR
+        self.frame_buffer = deque(maxlen=buffer_size)
+        self.frames = FramePool(width, height, FRAME_SLOTS)
+        self.canvas = Canvas()
+        #Clip en grabación (grabador.Clip) o None
+        self.clip = None
+        self.motion = MotionGate(MOTION_PIXEL_THRESHOLD, MOTION_MIN_CHANGED_FRACTION, KEYFRAME_INTERVAL)
+        #Resultado del último frame inferido, para reutilizarlo si el siguiente no se infiere
+        self.last_detections = {}
+        #Regla que disparó cada ID en alerta del último frame: {track_id: ['speed', ...]}
+        self.alert_reasons = {}
+        self.last_seen = time.monotonic()
+        #Último seq del sobre recibido, para detectar frames perdidos
+        self.last_seq = None
+        #Frames de esta cámara que siguen dentro del pipeline
+        self.in_flight = 0
+
+    def track(self, frame, detections):
+        #Tracking: filas (x1, y1, x2, y2, track_id, ...) de BYTETracker
+        return self.tracker.update(detections, frame)
+
+    def analyze(self, tracks, current_time):
+        #Heurística sobre los tracks del frame. Devuelve {track_id: {'pos', 'box'}}
+        #y los IDs en alerta. current_time es la hora de captura si el emisor la
+        #manda en el sobre
+        current_frame_detections = {}
+        reasons = {}
+
+        if len(tracks):
+            boxes = tracks[:, :4].astype(int)
+            ids = tracks[:, 4].astype(int)
+            centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+
+            #Velocidad suavizada por el tiempo real entre frames (fps adaptativo,
+            #frames perdidos o sin inferir). SPEED_THRESHOLD es en px por frame a self.fps
+            speeds, has_velocity = self.tracks.update(ids, centers, current_time)
+            if self.tracks.overflow:
+                TRACKS_OVERFLOW.inc(self.camera_id, amount=self.tracks.overflow)
+            fast = velocity_alerts(speeds, has_velocity, SPEED_THRESHOLD * self.fps)
+            reasons = alert_reasons(ids, centers, fast, PROXIMITY_THRESHOLD)
+
+            for box, track_id, center in zip(boxes, ids, centers):
+                current_pos = (int(center[0]), int(center[1]))
+                current_frame_detections[track_id] = {'pos': current_pos, 'box': box}
+
+        self.tracks.expire(current_time)
+
+        self.last_detections = current_frame_detections
+        self.alert_reasons = reasons
+        ACTIVE_TRACKS.set(len(self.tracks), self.camera_id)
+        return current_frame_detections, set(reasons)
+
+    def close(self):
+        if self.clip is not None:
+            self.clip.close()
+            self.clip = None
+        self.frame_buffer.clear()
+        self.tracks.clear()
+        self.frames.clear()
+        ACTIVE_TRACKS.remove(self.camera_id)
+
+
+class SessionManager:
+    #Crea la sesión la primera vez que aparece un app_id y la descarta
+    #cuando la cámara lleva idle_seconds sin enviar frames. Las etapas del
+    #pipeline usan las sesiones desde varios hilos, de ahí el lock.
+
+    def __init__(self, idle_seconds, **session_kwargs):
+        self.idle_seconds = idle_seconds
+        self.session_kwargs = session_kwargs
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, camera_id):
+        #Devuelve la sesión y la marca como en uso hasta release()
+        with self.lock:
+            session = self.sessions.get(camera_id)
+            if session is None:
+                session = CameraSession(camera_id, **self.session_kwargs)
+                self.sessions[camera_id] = session
+                ACTIVE_SESSIONS.set(len(self.sessions))
+                print(f"--- [PROCESAMIENTO] Nueva sesión para la cámara '{camera_id}'. ---")
+            session.last_seen = time.monotonic()
+            session.in_flight += 1
+            return session
+
+    def camera_ids(self):
+        #Cámaras con sesión abierta; seguro de llamar desde cualquier hilo
+        with self.lock:
+            return list(self.sessions)
+
+    def release(self, session):
+        with self.lock:
+            session.in_flight -= 1
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [cid for cid, s in self.sessions.items()
+                    if s.in_flight == 0 and now - s.last_seen > self.idle_seconds]
+            evicted = [self.sessions.pop(cid) for cid in idle]
+            ACTIVE_SESSIONS.set(len(self.sessions))
+        for session in evicted:
+            session.close()
+            print(f"--- [PROCESAMIENTO] Sesión de '{session.camera_id}' cerrada por inactividad. ---")
+        return idle
+
+    def close_all(self):
+        with self.lock:
+            evicted = list(self.sessions.values())
+            self.sessions.clear()
+            ACTIVE_SESSIONS.set(0)
+        for session in evicted:
+            session.close()
@@ -0,0 +1,122 @@
+# --- IMPORTS ---
+import html
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+import cv2
+
+## ----------------------------------------------------------------
+## VISTA PREVIA MJPEG POR HTTP (OPCIONAL)
+## ----------------------------------------------------------------
+#Reemplaza a cv2.imshow: el nodo corre sin pantalla y, si PREVIEW_ENABLED=1,
+#sirve las cámaras anotadas en http://host:PREVIEW_PORT/. El pipeline pregunta
+#wants(camera_id) antes de dibujar: solo es True si alguien está mirando esa
+#cámara y ya pasó 1/fps desde el último frame, así que sin espectadores la
+#vista previa no cuesta nada. Los frames se achican a `width` antes de
+#codificarlos a JPEG.
+BOUNDARY = 'frame'
+
+
+class PreviewServer:
+    def __init__(self, host, port, fps, width, quality, cameras):
+        #cameras() devuelve los IDs de cámara activos, para la página índice
+        self.interval = 1.0 / fps
+        self.width = width
+        self.quality = quality
+        self.cameras = cameras
+        self.viewers = {}
+        self.latest = {}
+        self.last_sent = {}
+        self.condition = threading.Condition()
+        handler = type('Handler', (PreviewHandler,), {'preview': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='preview-http', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        print(f"--- [PROCESAMIENTO] Vista previa en http://{host}:{port}/ ---")
+
+    def stop(self):
+        self.server.shutdown()
+        with self.condition:
+            self.condition.notify_all()
+
+    def wants(self, camera_id):
+        #Lectura sin lock: en el peor caso se salta o se agrega un frame
+        if not self.viewers.get(camera_id):
+            return False
+        return time.monotonic() - self.last_sent.get(camera_id, 0.0) >= self.interval
+
+    def publish(self, camera_id, frame):
+        #Se llama desde el hilo de anotación con el lienzo de la sesión
+        height = int(frame.shape[0] * self.width / frame.shape[1])
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        ok, jpeg = cv2.imencode('.jpg', small, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if not ok:
+            return
+        with self.condition:
+            self.last_sent[camera_id] = time.monotonic()
+            self.latest[camera_id] = jpeg.tobytes()
+            self.condition.notify_all()
+
+    def _watch(self, camera_id, delta):
+        with self.condition:
+            self.viewers[camera_id] = self.viewers.get(camera_id, 0) + delta
+            if self.viewers[camera_id] <= 0:
+                del self.viewers[camera_id]
+                self.latest.pop(camera_id, None)
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    preview = None
+
+    def do_GET(self):
+        if self.path in ('/', '/index.html'):
+            self._index()
+        elif self.path.startswith('/camera/'):
+            self._stream(unquote(self.path[len('/camera/'):]))
+        else:
+            self.send_error(404)
+
+    def _index(self):
+        items = "".join(f'<li><a href="/camera/{quote(c, safe="")}">{html.escape(c)}</a></li>'
+                        for c in sorted(self.preview.cameras()))
+        body = f"<html><body><h3>Cámaras</h3><ul>{items}</ul></body></html>".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, camera_id):
+        preview = self.preview
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        preview._watch(camera_id, 1)
+        last = None
+        try:
+            while preview.thread.is_alive():
+                with preview.condition:
+                    preview.condition.wait_for(lambda: preview.latest.get(camera_id) is not last, timeout=5.0)
+                    jpeg = preview.latest.get(camera_id)
+                if jpeg is None or jpeg is last:
+                    continue
+                last = jpeg
+                self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(jpeg)}\r\n\r\n".encode('ascii'))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            preview._watch(camera_id, -1)
+
+    def log_message(self, format, *args):
+        pass
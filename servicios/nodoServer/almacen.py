@@ -0,0 +1,80 @@
+# --- IMPORTS ---
+import json
+import os
+import time
+
+## ----------------------------------------------------------------
+## ALMACÉN DE ALERTAS EN SEGMENTOS JSONL
+## ----------------------------------------------------------------
+#Cada alerta es una línea JSON. Los segmentos solo crecen (append-only) y se
+#rota a uno nuevo al pasar max_bytes o al cambiar de día. write_batch() escribe
+#todo el lote de una vez y hace fsync antes de volver: recién entonces se
+#pueden confirmar los mensajes a RabbitMQ.
+
+
+class SegmentStore:
+    def __init__(self, directory, max_bytes, prefix='alerts'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.file = None
+        self.path = None
+        self.day = None
+        self.sequence = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_segment(self):
+        if self.file is not None:
+            self.file.close()
+        now = time.localtime()
+        self.day = time.strftime("%Y%m%d", now)
+        #Número de secuencia con ceros a la izquierda en todos los nombres: el
+        #orden alfabético de los segmentos es el orden de escritura, aunque se
+        #roten dos en el mismo segundo (reindex los lee con sorted())
+        self.sequence = self._last_sequence() + 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S', now)}-{self.sequence:06d}.jsonl"
+        self.path = os.path.join(self.directory, name)
+        self.file = open(self.path, 'ab')
+        print(f"--- [LOG SERVER] Nuevo segmento de alertas: {self.path} ---")
+
+    def _last_sequence(self):
+        #Al arrancar se sigue desde el último segmento del directorio
+        if self.sequence is not None:
+            return self.sequence
+        last = 0
+        for name in os.listdir(self.directory):
+            if not (name.startswith(self.prefix + '-') and name.endswith('.jsonl')):
+                continue
+            number = name[:-6].rsplit('-', 1)[-1]
+            if len(number) == 6 and number.isdigit():
+                last = max(last, int(number))
+        return last
+
+    def _needs_rotation(self):
+        return (self.file is None
+                or self.file.tell() >= self.max_bytes
+                or time.strftime("%Y%m%d") != self.day)
+
+    def write_batch(self, records):
+        if not records:
+            return
+        if self._needs_rotation():
+            self._open_segment()
+        data = b''.join(json.dumps(r, ensure_ascii=False).encode('utf-8') + b'\n' for r in records)
+        offset = self.file.tell()
+        try:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        except OSError:
+            #No dejar medio lote en el segmento: el lote se reentrega entero
+            try:
+                self.file.truncate(offset)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,178 @@
+# --- IMPORTS ---
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from indice import AlertIndex
+
+## ----------------------------------------------------------------
+## CONSULTAS SOBRE EL HISTORIAL DE ALERTAS
+## ----------------------------------------------------------------
+#Endpoint HTTP local (lo levanta log_server.py) y CLI sobre el mismo índice.
+#  GET /alerts?camera=X&type=INCIDENT_OPEN&since=...&until=...&limit=100&cursor=...
+#  GET /alerts/counts?camera=X&type=INCIDENT_OPEN&since=...&until=...&bucket=3600
+#type filtra por alert_type (p. ej. contar incidentes y no cada actualización).
+#since/until aceptan segundos epoch o fechas locales "2025-06-10" / "2025-06-10 14:30".
+#
+#CLI:
+#  python consulta.py alerts --camera cam-1 --since "2025-06-10" --until "2025-06-11"
+#  python consulta.py counts --bucket 86400 --type INCIDENT_OPEN
+#  python consulta.py reindex      (reconstruye el índice desde logs/alerts/*.jsonl)
+INDEX_PATH = 'logs/alerts.db'
+SEGMENTS_DIR = 'logs/alerts'
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def parse_time(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha no reconocida: {value!r}")
+
+
+def encode_cursor(cursor):
+    return None if cursor is None else f"{cursor[0]!r}:{cursor[1]}"
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        ts, row_id = value.rsplit(':', 1)
+        return float(ts), int(row_id)
+    except ValueError:
+        raise ValueError(f"Cursor inválido: {value!r}") from None
+
+
+## ----------------------------------------------------------------
+## SERVIDOR HTTP
+## ----------------------------------------------------------------
+class QueryHandler(BaseHTTPRequestHandler):
+    index_path = INDEX_PATH
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        #Una conexión de solo lectura por consulta: abrir SQLite es barato y el
+        #hilo de ingesta sigue escribiendo con la suya
+        try:
+            self.index = AlertIndex(self.index_path, readonly=True)
+        except sqlite3.OperationalError:
+            #La base se crea con la primera ingesta
+            self._reply(503, {'error': 'índice no disponible todavía'})
+            return
+        try:
+            start = parse_time(params.get('since'))
+            end = parse_time(params.get('until'))
+            camera_id = params.get('camera')
+            alert_type = params.get('type')
+            if url.path == '/alerts':
+                alerts, cursor = self.index.query(start, end, camera_id, params.get('limit', 100),
+                                                  decode_cursor(params.get('cursor')), alert_type)
+                self._reply(200, {'alerts': alerts, 'next_cursor': encode_cursor(cursor)})
+            elif url.path == '/alerts/counts':
+                counts = self.index.counts(start, end, camera_id, params.get('bucket', 3600), alert_type)
+                self._reply(200, {'counts': counts})
+            else:
+                self._reply(404, {'error': 'ruta no encontrada'})
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+        except sqlite3.OperationalError as e:
+            self._reply(503, {'error': f'índice no disponible: {e}'})
+        finally:
+            self.index.close()
+
+    def _reply(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        #Sin una línea de log por consulta
+        pass
+
+
+def start_query_server(index_path, host, port):
+    handler = type('Handler', (QueryHandler,), {'index_path': index_path})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='query-http', daemon=True).start()
+    print(f"--- [LOG SERVER] Consultas de alertas en http://{host}:{port}/alerts ---")
+    return server
+
+
+## ----------------------------------------------------------------
+## CLI
+## ----------------------------------------------------------------
+def reindex(index_path, segments_dir):
+    index = AlertIndex(index_path)
+    index.clear()
+    total = read = 0
+    for path in sorted(glob.glob(os.path.join(segments_dir, '*.jsonl'))):
+        with open(path, encoding='utf-8') as segment:
+            records = [json.loads(line) for line in segment if line.strip()]
+        #Las alertas reentregadas por RabbitMQ están dos veces en los segmentos;
+        #el índice se queda con la primera por message_id
+        total += index.insert_batch(records)
+        read += len(records)
+    index.close()
+    print(f"{total} alertas indexadas desde {segments_dir} ({read - total} repetidas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas sobre el historial de alertas")
+    parser.add_argument('--db', default=INDEX_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    alerts = sub.add_parser('alerts')
+    counts = sub.add_parser('counts')
+    for p in (alerts, counts):
+        p.add_argument('--camera')
+        p.add_argument('--since')
+        p.add_argument('--until')
+        p.add_argument('--type')
+    alerts.add_argument('--limit', type=int, default=100)
+    alerts.add_argument('--cursor')
+    counts.add_argument('--bucket', type=int, default=3600)
+    rebuild = sub.add_parser('reindex')
+    rebuild.add_argument('--segments', default=SEGMENTS_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'reindex':
+        reindex(args.db, args.segments)
+        return
+
+    index = AlertIndex(args.db, readonly=True)
+    start, end = parse_time(args.since), parse_time(args.until)
+    if args.command == 'alerts':
+        rows, cursor = index.query(start, end, args.camera, args.limit, decode_cursor(args.cursor), args.type)
+        for row in rows:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row['timestamp']))
+            print(f"{when}  {row['camera_id']}  {row['alert_type']}")
+        if cursor is not None:
+            print(f"-- siguiente página: --cursor {encode_cursor(cursor)}")
+    else:
+        for row in index.counts(start, end, args.camera, args.bucket, args.type):
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row['bucket']))
+            print(f"{row['camera_id']}  {when}  {row['count']}")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# --- IMPORTS ---
+import json
+import sqlite3
+
+## ----------------------------------------------------------------
+## ÍNDICE DE ALERTAS EN SQLITE
+## ----------------------------------------------------------------
+#Los segmentos JSONL (almacen.py) son el registro durable; esta base es el
+#índice para consultar. Los índices (camera_id, ts) y (ts) hacen que filtrar
+#por cámara y rango de tiempo no dependa del tamaño del historial, y la
+#paginación es por cursor (ts, id) en vez de OFFSET, que se vuelve lenta con
+#millones de filas. En modo WAL el hilo de consultas lee mientras se inserta.
+#message_id es único: una alerta que RabbitMQ reentrega (o que aparece dos veces
+#en los segmentos) se indexa una sola vez. Las alertas sin message_id (emisores
+#viejos) quedan en NULL y no se deduplican.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    camera_id TEXT NOT NULL,
+    alert_type TEXT,
+    received_at REAL,
+    payload TEXT NOT NULL,
+    message_id TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_camera_ts ON alerts (camera_id, ts, id);
+CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts, id);
+"""
+MESSAGE_ID_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS alerts_message_id ON alerts (message_id)"
+
+MAX_PAGE_SIZE = 1000
+
+
+class AlertIndex:
+    def __init__(self, path, readonly=False):
+        self.path = path
+        if readonly:
+            self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.executescript(SCHEMA)
+            #Bases creadas antes de message_id: agregar la columna
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(alerts)")]
+            if 'message_id' not in columns:
+                self.db.execute("ALTER TABLE alerts ADD COLUMN message_id TEXT")
+            self.db.execute(MESSAGE_ID_INDEX)
+
+    def insert_batch(self, records):
+        #Un lote entero en una sola transacción. Devuelve cuántas alertas se
+        #agregaron (las repetidas por message_id se ignoran)
+        rows = [(r.get('timestamp') or r.get('received_at'), r.get('camera_id'), r.get('alert_type'),
+                 r.get('received_at'), json.dumps(r, ensure_ascii=False), r.get('message_id'))
+                for r in records]
+        before = self.db.total_changes
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO alerts (ts, camera_id, alert_type, received_at, payload, message_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+        return self.db.total_changes - before
+
+    def query(self, start=None, end=None, camera_id=None, limit=100, cursor=None, alert_type=None):
+        #Alertas en [start, end) ordenadas por tiempo. Devuelve (filas, cursor
+        #de la página siguiente o None)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        where, params = self._filters(start, end, camera_id, alert_type)
+        if cursor is not None:
+            where.append("(ts > ? OR (ts = ? AND id > ?))")
+            params += [cursor[0], cursor[0], cursor[1]]
+        sql = "SELECT id, ts, camera_id, alert_type, payload FROM alerts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts, id LIMIT ?"
+        rows = self.db.execute(sql, params + [limit + 1]).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][1], rows[-1][0])
+        alerts = [dict(json.loads(payload), id=row_id, camera_id=camera, alert_type=kind, timestamp=ts)
+                  for row_id, ts, camera, kind, payload in rows]
+        return alerts, next_cursor
+
+    def counts(self, start=None, end=None, camera_id=None, bucket_seconds=3600, alert_type=None):
+        #Cantidad de alertas por cámara y por intervalo de bucket_seconds
+        bucket_seconds = max(1, int(bucket_seconds))
+        where, params = self._filters(start, end, camera_id, alert_type)
+        sql = "SELECT camera_id, CAST(ts / ? AS INTEGER) * ? AS bucket, COUNT(*) FROM alerts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY camera_id, bucket ORDER BY camera_id, bucket"
+        rows = self.db.execute(sql, [bucket_seconds, bucket_seconds] + params).fetchall()
+        return [{'camera_id': camera, 'bucket': bucket, 'count': count} for camera, bucket, count in rows]
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM alerts")
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def _filters(start, end, camera_id, alert_type):
+        where, params = [], []
+        if alert_type is not None:
+            where.append("alert_type = ?")
+            params.append(alert_type)
+        if camera_id is not None:
+            where.append("camera_id = ?")
+            params.append(camera_id)
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            params.append(end)
+        return where, params
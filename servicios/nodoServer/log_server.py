@@ -5,6 +5,11 @@ import os
 import ssl
 import traceback
 import json
+from almacen import SegmentStore
+from consulta import start_query_server
+from indice import AlertIndex
+from comun.metricas import start_metrics_server
+import metricas
 
 print("--- [LOG SERVER] Iniciando servicio de logs. ---")
 
@@ -19,6 +24,25 @@ CLIENT_CERT_PATH = os.getenv('CLIENT_CERT')
 CLIENT_KEY_PATH = os.getenv('CLIENT_KEY')
 
 LOG_FILE_PATH = 'logs/system_alerts.log'
+ALERTS_DIR = 'logs/alerts'
+ALERTS_INDEX_PATH = 'logs/alerts.db'
+
+#Endpoint local de consultas sobre el historial (ver consulta.py)
+QUERY_HOST = os.getenv('QUERY_HOST', '127.0.0.1')
+QUERY_PORT = int(os.getenv('QUERY_PORT', 8081))
+
+#Endpoint /metrics (formato Prometheus) del servidor de logs
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9102))
+
+#Ingesta por lotes: RabbitMQ entrega hasta INGEST_PREFETCH alertas sin confirmar;
+#se escriben juntas cuando hay FLUSH_MAX_BATCH o pasan FLUSH_INTERVAL_MS desde
+#la primera, y se confirman con un solo ack (multiple=True) después del fsync
+#del almacén.
+INGEST_PREFETCH = int(os.getenv('INGEST_PREFETCH', 500))
+FLUSH_MAX_BATCH = int(os.getenv('FLUSH_MAX_BATCH', 200))
+FLUSH_INTERVAL_MS = float(os.getenv('FLUSH_INTERVAL_MS', 200))
+SEGMENT_MAX_BYTES = int(os.getenv('SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
 
 #Asegurarse de que la carpeta de logs exista
 os.makedirs('logs', exist_ok=True)
@@ -70,39 +94,160 @@ if not connection:
 ## ----------------------------------------------------------------
 ## LÓGICA DE ALERTAS 
 ## ----------------------------------------------------------------
+store = SegmentStore(ALERTS_DIR, SEGMENT_MAX_BYTES)
+index = AlertIndex(ALERTS_INDEX_PATH)
+query_server = start_query_server(ALERTS_INDEX_PATH, QUERY_HOST, QUERY_PORT)
+start_metrics_server(METRICS_HOST, METRICS_PORT)
+print(f"--- [LOG SERVER] Métricas en http://{METRICS_HOST}:{METRICS_PORT}/metrics ---")
+
+#Lote pendiente: registros a escribir y el último delivery_tag recibido
+pending_records = []
+pending_lines = []
+last_delivery_tag = None
+batch_opened_at = None
+
+
 def alert_callback(ch, method, properties, body):
+    global last_delivery_tag, batch_opened_at
     camera_id = properties.app_id if properties and properties.app_id else "Cámara desconocida"
     try:
-        #Decodificar el mensaje JSON
+        #Decodificar el mensaje JSON y armar todo lo que depende de su contenido
+        #(registro, línea de texto, demora): un payload malo se descarta acá y
+        #no tumba al consumidor, que volvería a recibirlo al reiniciar
         alert_data = json.loads(body)
-        alert_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(alert_data.get('timestamp')))
-        
-        # Formatear y escribir el log
-        log_message = f"ALERTA: Agresión detectada a las {alert_time} desde {camera_id}\n"
-        
-        with open(LOG_FILE_PATH, 'a') as log_file:
-            log_file.write(log_message)
-            
-        
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        
-    except Exception as e:
+        if not isinstance(alert_data, dict):
+            raise ValueError(f"se esperaba un objeto JSON, llegó {type(alert_data).__name__}")
+        timestamp = alert_data.get('timestamp')
+        alert_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        line = alert_line(alert_data, alert_time, camera_id)
+        record = dict(alert_data, camera_id=camera_id, received_at=time.time())
+        delay = max(0.0, record['received_at'] - timestamp) if timestamp else None
+    except Exception:
+        #Un mensaje inválido no debe bloquear el ack del lote: se descarta
         print("Error procesando mensaje de alerta:")
         traceback.print_exc()
+        metricas.ALERTS_INVALID.inc()
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        return
+
+    if properties and properties.message_id:
+        record['message_id'] = properties.message_id
+    pending_records.append(record)
+    metricas.ALERTS_RECEIVED.inc(camera_id, str(alert_data.get('alert_type')))
+    if delay is not None:
+        metricas.ALERT_DELAY.observe(delay)
+    metricas.PENDING_ALERTS.set(len(pending_records))
+    if line:
+        pending_lines.append(line)
+    last_delivery_tag = method.delivery_tag
+    if batch_opened_at is None:
+        batch_opened_at = time.monotonic()
+
+    if len(pending_records) >= FLUSH_MAX_BATCH:
+        flush(ch)
+
+
+def alert_line(alert_data, alert_time, camera_id):
+    #Línea del log de texto. Los incidentes escriben al abrir y al cerrar; las
+    #actualizaciones solo quedan en el almacén. Un campo con tipo equivocado
+    #levanta TypeError/ValueError y el mensaje se descarta (alert_callback)
+    alert_type = alert_data.get('alert_type')
+    if alert_type == 'INCIDENT_OPEN':
+        return (f"ALERTA: Agresión detectada a las {alert_time} desde {camera_id} "
+                f"(incidente {alert_data.get('incident_id')})\n")
+    if alert_type == 'INCIDENT_CLOSE':
+        duration = alert_data.get('last_alert_at', 0) - alert_data.get('started_at', 0)
+        return (f"INCIDENTE {alert_data.get('incident_id')} cerrado a las {alert_time} desde {camera_id}: "
+                f"{alert_data.get('alert_count')} alertas en {duration:.0f} s, "
+                f"personas {alert_data.get('track_ids')}, clips {alert_data.get('clips')}\n")
+    if alert_type == 'INCIDENT_UPDATE':
+        return None
+    return f"ALERTA: Agresión detectada a las {alert_time} desde {camera_id}\n"
+
+
+def time_until_flush():
+    if batch_opened_at is None:
+        return None
+    return max(0.0, batch_opened_at + FLUSH_INTERVAL_MS / 1000.0 - time.monotonic())
+
+
+def flush(ch):
+    if last_delivery_tag is None:
+        return
+
+    #Primero el almacén (con fsync) y, si quedó escrito, el ack: los segmentos
+    #son el registro durable. El índice y el log de texto van después y un error
+    #en ellos no frena la ingesta; el índice se reconstruye desde los segmentos
+    #(consulta.py reindex). Si falla el almacén el lote vuelve a la cola y, si
+    #alcanzó a escribirse en parte, reindex descarta las repetidas por message_id
+    started = time.perf_counter()
+    try:
+        store.write_batch(pending_records)
+    except Exception as e:
+        print(f"--- [LOG SERVER] Error escribiendo el lote en el almacén: {e}. Se reintenta. ---")
+        metricas.FLUSH_ERRORS.inc('store')
+        ch.basic_nack(delivery_tag=last_delivery_tag, multiple=True, requeue=True)
+        clear_batch()
+        return
+    stored = time.perf_counter()
+    ch.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+
+    try:
+        index.insert_batch(pending_records)
+    except Exception as e:
+        print(f"--- [LOG SERVER] Error indexando el lote: {e} ---")
+        metricas.FLUSH_ERRORS.inc('index')
+    indexed = time.perf_counter()
+    try:
+        with open(LOG_FILE_PATH, 'a') as log_file:
+            log_file.writelines(pending_lines)
+    except OSError as e:
+        print(f"--- [LOG SERVER] Error escribiendo el log de texto: {e} ---")
+        metricas.FLUSH_ERRORS.inc('text_log')
+    written = time.perf_counter()
+
+    metricas.STAGE_SECONDS.observe(stored - started, 'store')
+    metricas.STAGE_SECONDS.observe(indexed - stored, 'index')
+    metricas.STAGE_SECONDS.observe(written - indexed, 'text_log')
+    metricas.BATCH_SIZE.observe(len(pending_records))
+    clear_batch()
+
+
+def clear_batch():
+    global last_delivery_tag, batch_opened_at
+    metricas.PENDING_ALERTS.set(0)
+    pending_records.clear()
+    pending_lines.clear()
+    last_delivery_tag = None
+    batch_opened_at = None
+
 
 #Consumir mensajes de la cola
 try:
     channel = connection.channel()
     queue_name = 'alerts_log'
     channel.queue_declare(queue=queue_name, durable=True)
-    
+
+    channel.basic_qos(prefetch_count=INGEST_PREFETCH)
     channel.basic_consume(queue=queue_name, on_message_callback=alert_callback)
-    
+
     print(f"--- [LOG SERVER] Esperando alertas en la cola '{queue_name}'... ---")
-    channel.start_consuming()
+    while True:
+        due = time_until_flush()
+        connection.process_data_events(time_limit=1.0 if due is None else due)
+        if time_until_flush() == 0.0:
+            flush(channel)
 
 except KeyboardInterrupt:
     print("--- [LOG SERVER] Servicio detenido. ---")
 finally:
     if connection and not connection.is_closed:
-        connection.close()
\ No newline at end of file
+        #Lo que no alcanzó a escribirse queda sin ack y RabbitMQ lo reentrega
+        try:
+            flush(channel)
+        except Exception as e:
+            print(f"--- [LOG SERVER] No se pudo escribir el último lote: {e} ---")
+        connection.close()
+    query_server.shutdown()
+    store.close()
+    index.close()
@@ -0,0 +1,19 @@
+# --- IMPORTS ---
+#El núcleo (Counter, Gauge, Histogram y el endpoint /metrics) es común a los
+#tres servicios y vive en servicios/comun/metricas.py. La imagen copia comun/ en
+#/opt/servicios y lo pone en PYTHONPATH (ver el Dockerfile); desde el
+#repositorio se corre con PYTHONPATH apuntando a servicios/
+from comun.metricas import Counter, Gauge, Histogram
+
+## ----------------------------------------------------------------
+## MÉTRICAS DEL SERVIDOR DE LOGS
+## ----------------------------------------------------------------
+ALERTS_RECEIVED = Counter('alerts_received_total', 'Alertas y eventos de incidente recibidos',
+                          ['camera', 'alert_type'])
+ALERTS_INVALID = Counter('alerts_invalid_total', 'Mensajes de alerta descartados por no ser JSON válido')
+ALERT_DELAY = Histogram('alert_delay_seconds', 'Tiempo desde que se generó la alerta hasta que llegó aquí')
+PENDING_ALERTS = Gauge('pending_alerts', 'Alertas recibidas que esperan el próximo lote')
+BATCH_SIZE = Histogram('flush_batch_size', 'Alertas escritas por lote', buckets=(1, 5, 10, 25, 50, 100, 200, 500))
+FLUSH_ERRORS = Counter('flush_errors_total', 'Pasos de la escritura de un lote que fallaron', ['stage'])
+STAGE_SECONDS = Histogram('stage_seconds', 'Duración de cada paso de la escritura de un lote', ['stage'],
+                          buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))